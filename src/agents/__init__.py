@@ -1,5 +1,6 @@
 """Agents package initialization."""
 from .rag_agent import rag_agent, RAGAgent
 from .sql_agent import sql_agent, SQLAgent
+from .router import query_router, QueryRouter
 
-__all__ = ['rag_agent', 'RAGAgent', 'sql_agent', 'SQLAgent']
+__all__ = ['rag_agent', 'RAGAgent', 'sql_agent', 'SQLAgent', 'query_router', 'QueryRouter']
@@ -2,17 +2,137 @@
 RAG Agent for retrieval from GST rules documents.
 """
 import os
+import gc
+import asyncio
+import json
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional
 import logging
 import chromadb
+import diskcache
 from chromadb.config import Settings
 from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from ..config import CACHE_DIR
 from ..utils.llm import llm
+from ..utils.embedding_cache import get_embedding_cache
+from ..utils.pdf_extract import extract_text_from_pdf
+from ..utils.sqlite_vec_index import open_sqlite_vec_index
+from ..utils.semantic_cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of embedding batches in flight during async ingestion
+MAX_CONCURRENT_EMBED_REQUESTS = 16
+
+# Number of chunks embedded and written to ChromaDB per ingestion step
+MEGA_BATCH = 5000
+
+# Bound on items buffered between async ingestion pipeline stages
+PIPELINE_QUEUE_SIZE = 32
+
+# How often a blocked PDF producer thread checks whether ingestion was aborted
+PRODUCER_POLL_SECONDS = 0.5
+
+# Retrieval backend: "chroma" (default) or "sqlite-vec"
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma').lower()
+
+# Character budget for retrieved context passed on to the LLM
+MAX_CONTEXT_CHARS = int(os.getenv('MAX_CONTEXT_CHARS', 4000))
+
+# Cosine similarity above which a paraphrased query reuses cached context
+SIMILAR_QUERY_THRESHOLD = 0.92
+
+# Chunks whose simhashes differ in at most this many bits are near-duplicates
+SIMHASH_MAX_DISTANCE = 3
+
+
+def _simhash(text: str) -> int:
+    """64-bit simhash over word 3-shingles."""
+    words = text.lower().split()
+    shingles = [' '.join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))]
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def build_context(hits: list[tuple[str, dict, float]], max_chars: int = MAX_CONTEXT_CHARS) -> str:
+    """
+    Assemble retrieved chunks into a context string within a character budget.
+    
+    Chunks are taken nearest first, near-duplicates (e.g. overlapping splits)
+    are dropped, and assembly stops once the next chunk would exceed max_chars.
+    
+    Args:
+        hits: (document, metadata, distance) tuples, nearest first
+        max_chars: Maximum context length
+        
+    Returns:
+        Combined context with source labels
+    """
+    parts = []
+    seen = []
+    total = 0
+    for doc, meta, _ in hits:
+        fingerprint = _simhash(doc)
+        if any(bin(fingerprint ^ other).count('1') <= SIMHASH_MAX_DISTANCE for other in seen):
+            continue
+        part = f"[Source: {meta.get('source', 'unknown')}]\n{doc}"
+        if parts and total + len(part) + 2 > max_chars:
+            break
+        parts.append(part[:max_chars])
+        seen.append(fingerprint)
+        total += len(part) + 2
+    return "\n\n".join(parts)
+
+
+@lru_cache(maxsize=1024)
+def _cached_query_embedding(text: str) -> tuple[float, ...]:
+    """Embed a query, memoizing results in-process for repeated queries."""
+    return tuple(llm.cached_generate_embedding(text))
+
+
+def _end_stream_nowait(queue: asyncio.Queue):
+    """Queue the end-of-stream marker if there is room (used while tearing down)."""
+    try:
+        queue.put_nowait(None)
+    except asyncio.QueueFull:
+        pass  # the consumer is being cancelled too
+
+
+def _iter_pdf_chunks(pdf_path: Path, splitter: RecursiveCharacterTextSplitter) -> Iterator[str]:
+    """
+    Split a PDF into chunks page by page without materializing the full text.
+    
+    The last (possibly incomplete) chunk of each split is carried over and
+    re-split together with the next page, so chunk boundaries match splitting
+    the whole document while peak memory stays around one page.
+    """
+    reader = PdfReader(str(pdf_path))
+    carry = ""
+    for i in range(reader.get_num_pages()):
+        page = reader.get_page(i)
+        page_text = page.extract_text()
+        del page
+        if not page_text:
+            continue
+        
+        chunks = splitter.split_text(f"{carry}\n{page_text}" if carry else page_text)
+        if not chunks:
+            continue
+        carry = chunks.pop()
+        yield from chunks
+    
+    if carry.strip():
+        yield carry
+
 
 class RAGAgent:
     """RAG agent for querying GST rules and regulations."""
@@ -31,6 +151,13 @@ class RAGAgent:
         self.documents_path = Path(documents_path)
         self.collection_name = "gst_rules"
         
+        # Shared text splitter for all documents
+        self._splitter = RecursiveCharacterTextSplitter(
+            chunk_size=500,
+            chunk_overlap=50,
+            length_function=len
+        )
+        
         # Ensure directories exist
         self.vector_store_path.mkdir(parents=True, exist_ok=True)
         self.documents_path.mkdir(parents=True, exist_ok=True)
@@ -41,6 +168,18 @@ class RAGAgent:
             settings=Settings(anonymized_telemetry=False)
         )
         
+        # Optional sqlite-vec index, dual-written alongside ChromaDB
+        self.vec_index = None
+        if VECTOR_BACKEND == "sqlite-vec":
+            self.vec_index = open_sqlite_vec_index(str(self.vector_store_path / "vec_index.db"))
+        
+        # Retrieved context by (embedding model, collection, query, k, filters,
+        # budget), persisted across sessions; paraphrases are matched in memory
+        # by query embedding. Both are cleared on ingest and whenever chunks
+        # are added.
+        self._context_cache = diskcache.Cache(str(CACHE_DIR / 'rag'))
+        self._similar_queries: dict[tuple[int, int], SemanticCache] = {}
+        
         # Get or create collection
         self.collection = None
         self._initialize_collection()
@@ -59,7 +198,14 @@ class RAGAgent:
             logger.info("Creating new collection...")
             self.collection = self.client.create_collection(
                 name=self.collection_name,
-                metadata={"description": "GST Rules and Regulations"}
+                metadata={
+                    "description": "GST Rules and Regulations",
+                    # HNSW index tuning
+                    "hnsw:space": "cosine",
+                    "hnsw:M": 32,
+                    "hnsw:construction_ef": 200,
+                    "hnsw:search_ef": 64
+                }
             )
             
             # Auto-ingest documents if available
@@ -77,132 +223,434 @@ class RAGAgent:
     
     def _extract_text_from_pdf(self, pdf_path: Path) -> str:
         """Extract text from a PDF file."""
-        try:
-            reader = PdfReader(str(pdf_path))
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-        except Exception as e:
-            logger.error(f"Failed to extract PDF {pdf_path}: {e}")
-            return ""
+        return extract_text_from_pdf(pdf_path)
     
-    def ingest_documents(self):
+    def _extract_pdfs(self, pdf_paths: List[Path]) -> List[str]:
+        """Extract text from several PDFs in parallel across CPU cores."""
+        if len(pdf_paths) <= 1:
+            return [self._extract_text_from_pdf(p) for p in pdf_paths]
+        
+        max_workers = min(len(pdf_paths), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as ex:
+            return list(ex.map(extract_text_from_pdf, pdf_paths))
+    
+    def _split_document(self, path: Path, doc_type: str, text: str) -> List[tuple[str, dict, str]]:
         """
-        Ingest all documents from the documents folder into ChromaDB.
+        Split a document's text into chunks.
+        
+        Returns:
+            List of (chunk, metadata, id) tuples
+        """
+        if not text.strip():
+            return []
+        
+        chunks = self._splitter.split_text(text)
+        return [
+            (chunk, {"source": path.name, "type": doc_type, "chunk": i}, f"{path.stem}_chunk_{i}")
+            for i, chunk in enumerate(chunks)
+        ]
+    
+    def _collect_chunks(self) -> tuple[List[str], List[dict], List[str]]:
+        """
+        Load and split all documents from the documents folder.
+        
+        Returns:
+            Tuple of (documents, metadatas, ids)
         """
         documents = []
         metadatas = []
         ids = []
         
-        # Process PDF files
-        for pdf_file in self.documents_path.glob("*.pdf"):
+        # Process PDF files (text extraction runs in parallel)
+        pdf_paths = list(self.documents_path.glob("*.pdf"))
+        if pdf_paths:
+            logger.info(f"Extracting text from {len(pdf_paths)} PDF(s)...")
+        pdf_texts = self._extract_pdfs(pdf_paths)
+        
+        for pdf_file, text in zip(pdf_paths, pdf_texts):
             logger.info(f"Processing PDF: {pdf_file.name}")
-            text = self._extract_text_from_pdf(pdf_file)
-            
-            if text.strip():
-                # Split text into chunks
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=500,
-                    chunk_overlap=50,
-                    length_function=len
-                )
-                chunks = text_splitter.split_text(text)
-                
-                for i, chunk in enumerate(chunks):
-                    documents.append(chunk)
-                    metadatas.append({
-                        "source": pdf_file.name,
-                        "type": "pdf",
-                        "chunk": i
-                    })
-                    ids.append(f"{pdf_file.stem}_chunk_{i}")
+            for chunk, metadata, chunk_id in self._split_document(pdf_file, "pdf", text):
+                documents.append(chunk)
+                metadatas.append(metadata)
+                ids.append(chunk_id)
         
         # Process text files
         for txt_file in self.documents_path.glob("*.txt"):
             logger.info(f"Processing text file: {txt_file.name}")
             text = txt_file.read_text(encoding='utf-8')
-            
-            if text.strip():
-                # Split text into chunks
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=500,
-                    chunk_overlap=50,
-                    length_function=len
-                )
-                chunks = text_splitter.split_text(text)
-                
-                for i, chunk in enumerate(chunks):
-                    documents.append(chunk)
-                    metadatas.append({
-                        "source": txt_file.name,
-                        "type": "txt",
-                        "chunk": i
-                    })
-                    ids.append(f"{txt_file.stem}_chunk_{i}")
+            for chunk, metadata, chunk_id in self._split_document(txt_file, "txt", text):
+                documents.append(chunk)
+                metadatas.append(metadata)
+                ids.append(chunk_id)
+        
+        return documents, metadatas, ids
+    
+    def _embed_documents(self, documents: List[str]) -> List[List[float]]:
+        """Embed documents, calling the API only for chunks not already cached."""
+        model = llm.embedding_model
+        embedding_cache = get_embedding_cache()
+        embeddings, uncached = embedding_cache.find_uncached_texts(model, documents)
+        logger.info(f"{len(embeddings)} chunks cached, {len(uncached)} to embed")
+        
+        if uncached:
+            # Generate embeddings using Gemini (many chunks per request)
+            texts = [documents[i] for i in uncached]
+            vectors = llm.generate_embeddings_batch(texts, batch_size=96)
+            embedding_cache.put_many(model, texts, vectors)
+            embeddings.update(zip(uncached, vectors))
+        return [embeddings[i] for i in range(len(documents))]
+    
+    def _add_chunks(self,
+                    documents: List[str],
+                    embeddings: List[List[float]],
+                    metadatas: List[dict],
+                    ids: List[str]):
+        """Write embedded chunks to ChromaDB and, if enabled, the sqlite-vec index."""
+        self.collection.add(
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids
+        )
+        if self.vec_index is not None:
+            self.vec_index.add(documents, embeddings, metadatas, ids)
+        self._clear_context_cache()
+    
+    def _clear_context_cache(self):
+        """Drop cached retrieval results (the indexed corpus changed)."""
+        self._context_cache.clear()
+        self._similar_queries.clear()
+    
+    def _context_cache_key(self, query: str, k: int, filters: Optional[dict], max_chars: int) -> bytes:
+        """Hash retrieval arguments, embedding model and collection into a compact cache key."""
+        raw = (f"{llm.embedding_model}\x00{self.collection_name}\x00{self.collection.id}\x00"
+               f"{query.strip().lower()}\x00{k}\x00{json.dumps(filters, sort_keys=True)}\x00{max_chars}")
+        return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).digest()
+    
+    def ingest_documents(self):
+        """
+        Ingest all documents from the documents folder into ChromaDB.
+        
+        Chunks are embedded and added in mega-batches of MEGA_BATCH so
+        memory stays bounded on large corpora.
+        """
+        self._clear_context_cache()
+        documents, metadatas, ids = self._collect_chunks()
         
         # Add to ChromaDB with embeddings
         if documents:
             logger.info(f"Adding {len(documents)} chunks to vector store...")
             
-            # Generate embeddings using Gemini
-            embeddings = []
-            for doc in documents:
-                embedding = llm.generate_embedding(doc)
-                embeddings.append(embedding)
-            
-            # Add to collection
-            self.collection.add(
-                documents=documents,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                ids=ids
-            )
+            for start in range(0, len(documents), MEGA_BATCH):
+                end = start + MEGA_BATCH
+                slice_docs = documents[start:end]
+                slice_embs = self._embed_documents(slice_docs)
+                
+                # Add to collection
+                self._add_chunks(slice_docs, slice_embs, metadatas[start:end], ids[start:end])
+                logger.info(f"Added chunks {start + 1}-{start + len(slice_docs)} of {len(documents)}")
+                
+                del slice_docs, slice_embs
+                gc.collect()
             
             logger.info(f"Successfully ingested {len(documents)} document chunks")
         else:
             logger.warning("No documents to ingest")
     
-    def retrieve_context(self, query: str, k: int = 5) -> str:
+    async def ingest_documents_async(self, batch_size: int = 96):
         """
-        Retrieve relevant context for a query.
+        Ingest all documents through a pipelined parse -> split -> embed -> write flow.
+        
+        Stages run concurrently and are connected by bounded queues, so PDF
+        parsing, embedding requests and ChromaDB writes overlap. PDFs are split
+        page by page and never held in memory as one string. Up to
+        MAX_CONCURRENT_EMBED_REQUESTS embedding batches are in flight at once.
+        If any stage fails, the whole pipeline (including PDF producer
+        threads) is stopped and the error is raised. ingest_documents remains
+        the synchronous fallback.
+        
+        Args:
+            batch_size: Texts per embedding request
+        """
+        self._clear_context_cache()
+        batch_size = max(1, min(batch_size, llm.max_embed_batch))
+        model = llm.embedding_model
+        # The embedding cache is synchronous SQLite: open and use it off the event loop
+        embedding_cache = await asyncio.to_thread(get_embedding_cache)
+        loop = asyncio.get_running_loop()
+        
+        split_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        embed_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE * batch_size)
+        write_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        sem = asyncio.Semaphore(MAX_CONCURRENT_EMBED_REQUESTS)
+        # Set on failure so producer threads stop waiting on a dead pipeline
+        aborted = threading.Event()
+        total = 0
+        
+        async def stream_pdf(path: Path):
+            # Runs the page-by-page splitter in a thread, handing each chunk to
+            # the embed stage as soon as it is produced (with backpressure)
+            def put(record) -> bool:
+                future = asyncio.run_coroutine_threadsafe(embed_q.put(record), loop)
+                while True:
+                    try:
+                        future.result(timeout=PRODUCER_POLL_SECONDS)
+                        return True
+                    except FutureTimeoutError:
+                        if aborted.is_set():
+                            future.cancel()
+                            return False
+            
+            def produce() -> int:
+                count = 0
+                for i, chunk in enumerate(_iter_pdf_chunks(path, self._splitter)):
+                    record = (chunk, {"source": path.name, "type": "pdf", "chunk": i},
+                              f"{path.stem}_chunk_{i}")
+                    if not put(record):
+                        break
+                    count += 1
+                return count
+            
+            try:
+                count = await asyncio.to_thread(produce)
+                logger.info(f"Streamed PDF: {path.name} ({count} chunks)")
+            except Exception as e:
+                logger.error(f"Failed to extract PDF {path}: {e}")
+        
+        async def parse_stage():
+            # PDFs are streamed straight to the embed stage; text files go via the splitter
+            pdf_paths = list(self.documents_path.glob("*.pdf"))
+            txt_paths = list(self.documents_path.glob("*.txt"))
+            pdf_tasks = [asyncio.create_task(stream_pdf(p)) for p in pdf_paths]
+            
+            try:
+                for path in txt_paths:
+                    text = await asyncio.to_thread(path.read_text, encoding='utf-8')
+                    logger.info(f"Parsed TXT: {path.name}")
+                    await split_q.put((path, "txt", text))
+                
+                await asyncio.gather(*pdf_tasks)
+                await split_q.put(None)
+            except BaseException:
+                for task in pdf_tasks:
+                    task.cancel()
+                _end_stream_nowait(split_q)
+                raise
+        
+        async def split_stage():
+            try:
+                while (item := await split_q.get()) is not None:
+                    for record in self._split_document(*item):
+                        await embed_q.put(record)
+                await embed_q.put(None)
+            except BaseException:
+                _end_stream_nowait(embed_q)
+                raise
+        
+        async def embed_batch(records: List[tuple[str, dict, str]]):
+            # Caller has acquired sem; released once the batch is queued for writing
+            try:
+                docs = [r[0] for r in records]
+                cached, uncached = await asyncio.to_thread(embedding_cache.find_uncached_texts, model, docs)
+                if uncached:
+                    texts = [docs[i] for i in uncached]
+                    vectors = await llm.agenerate_embeddings_batch(texts)
+                    await asyncio.to_thread(embedding_cache.put_many, model, texts, vectors)
+                    cached.update(zip(uncached, vectors))
+                await write_q.put((docs, [cached[i] for i in range(len(docs))],
+                                   [r[1] for r in records], [r[2] for r in records]))
+            finally:
+                sem.release()
+        
+        async def embed_stage():
+            tasks = set()
+            batch = []
+            failures = []
+            
+            def on_done(task: asyncio.Task):
+                tasks.discard(task)
+                if not task.cancelled() and task.exception() is not None:
+                    failures.append(task.exception())
+            
+            async def dispatch(records):
+                # Acquiring before spawning bounds in-flight batches (and memory)
+                await sem.acquire()
+                # A failed batch stops the stage now rather than after all input is read
+                if failures:
+                    sem.release()
+                    raise failures[0]
+                task = asyncio.create_task(embed_batch(records))
+                tasks.add(task)
+                task.add_done_callback(on_done)
+            
+            try:
+                while (record := await embed_q.get()) is not None:
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        await dispatch(batch)
+                        batch = []
+                if batch:
+                    await dispatch(batch)
+                await asyncio.gather(*tasks)
+                if failures:
+                    raise failures[0]
+                await write_q.put(None)
+            except BaseException:
+                for task in list(tasks):
+                    task.cancel()
+                _end_stream_nowait(write_q)
+                raise
+        
+        async def write_stage():
+            docs, embs, metas, ids = [], [], [], []
+            
+            async def flush():
+                nonlocal total
+                await asyncio.to_thread(self._add_chunks, docs, embs, metas, ids)
+                total += len(docs)
+                logger.info(f"Added {total} chunks so far")
+            
+            while (item := await write_q.get()) is not None:
+                for acc, values in zip((docs, embs, metas, ids), item):
+                    acc.extend(values)
+                if len(docs) >= MEGA_BATCH:
+                    await flush()
+                    docs, embs, metas, ids = [], [], [], []
+            if docs:
+                await flush()
+        
+        logger.info("Starting pipelined ingestion...")
+        stages = [asyncio.create_task(stage())
+                  for stage in (parse_stage, split_stage, embed_stage, write_stage)]
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            # One stage failed (or we were cancelled): stop everything else
+            aborted.set()
+            for task in stages:
+                task.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            raise
+        
+        if total:
+            logger.info(f"Successfully ingested {total} document chunks")
+        else:
+            logger.warning("No documents to ingest")
+    
+    def retrieve_chunks(self, query: str, k: int = 5, filters: Optional[dict] = None) -> list[tuple[str, dict, float]]:
+        """
+        Retrieve the chunks nearest to a query.
         
         Args:
             query: User query
             k: Number of top results to retrieve
+            filters: Optional metadata pre-filter, e.g. {"type": "pdf"}
             
         Returns:
-            Combined context from relevant documents
+            List of (document, metadata, distance) tuples, nearest first
         """
         if self.collection.count() == 0:
             logger.warning("Vector store is empty. Cannot retrieve context.")
-            return ""
+            return []
+        
+        # Generate query embedding
+        query_embedding = list(_cached_query_embedding(query))
+        
+        if self.vec_index is not None and not filters and self.vec_index.count() > 0:
+            # Query sqlite-vec index
+            return self.vec_index.query(query_embedding, k)
+        
+        # Query ChromaDB
+        results = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=k,
+            where=filters
+        )
+        if not results or not results['documents'] or not results['documents'][0]:
+            return []
+        return list(zip(results['documents'][0], results['metadatas'][0], results['distances'][0]))
+    
+    def retrieve_context(self, query: str, k: int = 5, filters: Optional[dict] = None,
+                         max_chars: int = MAX_CONTEXT_CHARS) -> str:
+        """
+        Retrieve relevant context for a query.
+        
+        Args:
+            query: User query
+            k: Number of top results to retrieve
+            filters: Optional metadata pre-filter, e.g. {"type": "pdf"}
+            max_chars: Character budget for the combined context
+            
+        Returns:
+            Combined context from relevant documents
+        """
+        return self.retrieve_context_scored(query, k, filters, max_chars)[0]
+    
+    def retrieve_context_scored(self, query: str, k: int = 5, filters: Optional[dict] = None,
+                                max_chars: int = MAX_CONTEXT_CHARS) -> tuple[str, str, float]:
+        """
+        Retrieve relevant context along with the best-matching chunk.
+        
+        Args:
+            query: User query
+            k: Number of top results to retrieve
+            filters: Optional metadata pre-filter, e.g. {"type": "pdf"}
+            max_chars: Character budget for the combined context
+            
+        Returns:
+            Tuple of (combined context, top chunk with source label,
+            top chunk cosine similarity); ("", "", 0.0) if nothing was found
+        """
+        key = self._context_cache_key(query, k, filters, max_chars)
+        cached = self._context_cache.get(key)
+        if cached is not None:
+            logger.debug("Retrieved context from cache")
+            return cached
         
         try:
-            # Generate query embedding
-            query_embedding = llm.generate_embedding(query)
+            similar = None
+            emb = None
+            if not filters:
+                similar = self._similar_queries.get((k, max_chars))
+                if similar is None:
+                    similar = SemanticCache(threshold=SIMILAR_QUERY_THRESHOLD)
+                    self._similar_queries[(k, max_chars)] = similar
+                cached, emb = similar.lookup(query, lambda q: list(_cached_query_embedding(q)))
+                if cached is not None:
+                    logger.debug("Retrieved context for a similar cached query")
+                    # The top chunk and score belong to the earlier query, so
+                    # reuse only the context (no verbatim top-chunk answer)
+                    return cached[0], "", 0.0
             
-            # Query ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=k
-            )
+            hits = self.retrieve_chunks(query, k, filters)
             
             # Combine results
-            if results and results['documents'] and results['documents'][0]:
-                context_chunks = results['documents'][0]
-                context = "\n\n".join([f"[Source: {results['metadatas'][0][i]['source']}]\n{chunk}" 
-                                      for i, chunk in enumerate(context_chunks)])
+            if hits:
+                context = build_context(hits, max_chars)
+                top_doc, top_meta, top_distance = hits[0]
+                result = (
+                    context,
+                    build_context([(top_doc, top_meta, top_distance)], max_chars),
+                    1.0 - top_distance  # cosine distance -> similarity
+                )
+                
+                self._context_cache.set(key, result)
+                if similar is not None:
+                    similar.put(query, result, emb)
                 
-                logger.debug(f"Retrieved {len(context_chunks)} relevant chunks")
-                return context
+                logger.debug(f"Retrieved {len(hits)} relevant chunks ({len(context)} chars used)")
+                return result
             else:
                 logger.warning("No relevant context found")
-                return ""
+                return "", "", 0.0
                 
         except Exception as e:
             logger.error(f"Failed to retrieve context: {e}")
-            return ""
+            return "", "", 0.0
+    
+    async def aretrieve_context(self, query: str, k: int = 5, filters: Optional[dict] = None) -> str:
+        """Async variant of retrieve_context (runs the lookup in a worker thread)."""
+        return await asyncio.to_thread(self.retrieve_context, query, k, filters)
 
 
 # Global RAG agent instance
@@ -0,0 +1,173 @@
+"""
+Query router for classifying user queries without an LLM round-trip.
+"""
+import re
+import logging
+import threading
+from typing import Optional
+import numpy as np
+from ..utils.llm import llm
+
+logger = logging.getLogger(__name__)
+
+QUERY_TYPES = ("data", "regulatory", "hybrid")
+_QUERY_TYPE_SET = frozenset(QUERY_TYPES)
+
+# Keyword rules per class. Each matching pattern adds one point.
+DATA_PATTERNS = [
+    re.compile(r"\b(show|list|find|display|fetch|get)\b", re.I),
+    re.compile(r"\b(how many|count|total|sum|average|avg|top \d+|highest|lowest)\b", re.I),
+    re.compile(r"\b(invoices?|vendors?|suppliers?|transactions?|amounts?|records?|months?|returns? filed)\b", re.I),
+]
+REGULATORY_PATTERNS = [
+    re.compile(r"\b(what is|what are|what does)\b.*\b(rule|section|act|provision|itc|input tax credit)\b", re.I),
+    re.compile(r"\b(explain|define|definition|meaning|describe)\b", re.I),
+    re.compile(r"\b(rule\s*\d+\w*|section\s*\d+\w*|cgst|sgst|igst act|notification|circular)\b", re.I),
+]
+HYBRID_PATTERNS = [
+    re.compile(r"\b(violat\w*|breach\w*|non-?complian\w*|beyond( the)? limit)\b", re.I),
+]
+
+# "Exceed" is only a compliance question when it refers to a rule or limit;
+# "how many invoices exceed 50000" is a plain data query
+COMPARISON_PATTERN = re.compile(r"\bexceed\w*\b", re.I)
+RULE_TERM_PATTERN = re.compile(
+    r"\b(rules?|section|act|provisions?|itc|input tax credit|limits?|thresholds?|cgst|sgst|igst)\b", re.I
+)
+
+# Example queries whose embeddings act as label prototypes
+LABEL_EXAMPLES = {
+    "data": [
+        "Show me all invoices from Karnataka",
+        "What is the total tax collected?",
+        "List the top vendors by invoice amount",
+    ],
+    "regulatory": [
+        "What is Rule 86B?",
+        "Explain input tax credit limits",
+        "When is a taxpayer required to pay 1% of output tax in cash?",
+    ],
+    "hybrid": [
+        "Show invoices violating Rule 86B",
+        "Find transactions exceeding ITC limits",
+        "Which vendors are non-compliant with GST rules?",
+    ],
+}
+
+# Minimum similarity gap between the best and second-best prototype
+ROUTER_SIMILARITY_MARGIN = 0.05
+
+
+class QueryRouter:
+    """
+    Three-stage query classifier.
+
+    1. Keyword rules decide unambiguous queries locally.
+    2. Otherwise the query embedding is compared to per-label prototypes.
+    3. Only when the prototype margin is too small is the LLM asked.
+    """
+
+    def __init__(self, margin: float = ROUTER_SIMILARITY_MARGIN):
+        """
+        Initialize query router.
+
+        Args:
+            margin: Minimum prototype similarity gap to accept an embedding match
+        """
+        self.margin = margin
+        self._prototypes: Optional[np.ndarray] = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _score(patterns: list[re.Pattern], query: str) -> int:
+        return sum(1 for pattern in patterns if pattern.search(query))
+
+    def classify_by_rules(self, query: str) -> Optional[str]:
+        """
+        Classify a query using keyword rules.
+
+        Returns:
+            Query type, or None if the rules are inconclusive
+        """
+        data = self._score(DATA_PATTERNS, query)
+        regulatory = self._score(REGULATORY_PATTERNS, query)
+        hybrid = self._score(HYBRID_PATTERNS, query)
+        if not hybrid and COMPARISON_PATTERN.search(query) and RULE_TERM_PATTERN.search(query):
+            hybrid = 1
+
+        if hybrid and (data or regulatory):
+            return "hybrid"
+        if data >= 2 and regulatory:
+            return "hybrid"
+        if data >= 2 and not regulatory:
+            return "data"
+        if regulatory and not data:
+            return "regulatory"
+        return None
+
+    def _get_prototypes(self) -> np.ndarray:
+        """Embed the label examples once and return normalized label centroids."""
+        with self.lock:
+            if self._prototypes is None:
+                rows = []
+                for label in QUERY_TYPES:
+                    vecs = np.asarray(
+                        [llm.cached_generate_embedding(text) for text in LABEL_EXAMPLES[label]],
+                        dtype=np.float32
+                    )
+                    centroid = vecs.mean(axis=0)
+                    rows.append(centroid / (np.linalg.norm(centroid) or 1.0))
+                self._prototypes = np.vstack(rows)
+            return self._prototypes
+
+    def classify_by_embedding(self, query: str) -> Optional[str]:
+        """
+        Classify a query by cosine similarity to label prototypes.
+
+        Returns:
+            Query type, or None if the best match is not clearly ahead
+        """
+        emb = np.asarray(llm.cached_generate_embedding(query), dtype=np.float32)
+        emb /= np.linalg.norm(emb) or 1.0
+        sims = self._get_prototypes() @ emb
+        second, best = np.argsort(sims)[-2:]
+        if sims[best] - sims[second] < self.margin:
+            return None
+        return QUERY_TYPES[int(best)]
+
+    def classify_by_llm(self, query: str, prompt: str) -> str:
+        """Classify a query with the LLM, defaulting to hybrid if unclear."""
+        response = llm.generate_text(prompt).strip().lower()
+        # The prompt asks for one word; match it exactly (so "metadata" is not "data")
+        token = response.split()[0].strip('.,:;!"\'*`') if response else ""
+        return token if token in _QUERY_TYPE_SET else "hybrid"
+
+    def classify(self, query: str, prompt: str) -> tuple[str, str]:
+        """
+        Classify a query, escalating only when cheaper stages are inconclusive.
+
+        Args:
+            query: User query
+            prompt: Full classifier prompt for the LLM fallback
+
+        Returns:
+            Tuple of (query type, stage that decided: "rules", "embedding" or "llm")
+        """
+        query_type = self.classify_by_rules(query)
+        if query_type:
+            return query_type, "rules"
+
+        try:
+            # FakeEmbeddings are random vectors, so prototype matches would be noise
+            if not llm.embedding_model.startswith("fake"):
+                query_type = self.classify_by_embedding(query)
+                if query_type:
+                    return query_type, "embedding"
+        except Exception as e:
+            logger.warning(f"Embedding routing failed, falling back to LLM: {e}")
+
+        return self.classify_by_llm(query, prompt), "llm"
+
+
+# Global router instance
+query_router = QueryRouter()
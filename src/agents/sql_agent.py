@@ -1,27 +1,35 @@
 """
 SQL Agent for natural language to SQL conversion and execution.
 """
+import re
+import string
+import asyncio
+import hashlib
 import logging
-from typing import Optional, Dict, Any, List
-from ..database.connection import db
+import threading
+from typing import Final, Optional, Dict, Any, List
+from cachetools import TTLCache
+from ..database.connection import db, MAX_ROWS
+from .rag_agent import rag_agent
 from ..utils.llm import llm
 from ..utils.security import SQLValidator
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of generated SQL queries kept in memory, and their lifetime (seconds)
+SQL_CACHE_SIZE = 512
+SQL_CACHE_TTL = 3600
 
-class SQLAgent:
-    """Agent for converting natural language queries to SQL and executing them."""
-    
-    def __init__(self):
-        """Initialize SQL agent."""
-        self.validator = SQLValidator()
-        self.schema_context = self._get_schema_context()
-        logger.info("SQL Agent initialized")
-    
-    def _get_schema_context(self) -> str:
-        """Get database schema information for context."""
-        schema = """
+# Result columns formatted as rupee amounts
+CURRENCY_KEYS = frozenset({'total_amount', 'tax_amount', 'cgst', 'sgst', 'igst', 'unit_price'})
+
+# Non-printable characters stripped from generated SQL
+_SQL_CLEAN_RE = re.compile(r'[^\x20-\x7E\n\r\t]')
+# Clause keywords that get their own line when formatting SQL
+_SQL_FORMAT_RE = re.compile(r'\s+(FROM|WHERE|ORDER BY)\s+')
+
+# Static database schema description included in every SQL generation prompt
+_SCHEMA_CONTEXT: Final[str] = """
 Database Schema:
 
 1. vendors table:
@@ -60,21 +68,9 @@ Important Notes:
 - tax_amount = cgst + sgst + igst
 - Use JOINs to combine data from multiple tables
 """
-        return schema
-    
-    def generate_sql(self, query: str, context: Optional[str] = None) -> str:
-        """
-        Convert natural language query to SQL.
-        
-        Args:
-            query: Natural language query
-            context: Optional RAG context (e.g., GST rules) to inform SQL generation
-            
-        Returns:
-            Generated SQL query
-        """
-        # Build prompt
-        prompt = f"""{self.schema_context}
+
+# SQL generation prompt; the static preamble is interpolated once at import
+_PROMPT_TEMPLATE: Final[string.Template] = string.Template(_SCHEMA_CONTEXT + """
 
 Task: Convert the following natural language query to a MySQL SELECT query.
 
@@ -120,30 +116,125 @@ IMPORTANT PATTERNS:
    - When context mentions limits (like ₹50 lakh), apply to aggregates not individuals
    - Include both the threshold check AND supporting invoice details
 
-"""
-        
-        if context:
-            prompt += f"""Additional Context (GST Rules):
-{context}
+${context_block}Natural Language Query: $query
+
+SQL Query:""")
+
+_CONTEXT_TEMPLATE: Final[string.Template] = string.Template("""Additional Context (GST Rules):
+$context
 
 Use this context to inform your SQL query (e.g., if the context mentions specific limits or thresholds, incorporate them).
 Pay special attention to whether the rule applies to individual transactions or aggregated amounts.
 
-"""
-        
-        prompt += f"""Natural Language Query: {query}
+""")
 
-SQL Query:"""
+
+class SQLAgent:
+    """Agent for converting natural language queries to SQL and executing them."""
+    
+    def __init__(self):
+        """Initialize SQL agent."""
+        self.validator = SQLValidator()
+        self.schema_context = _SCHEMA_CONTEXT
         
-        try:
-            # Generate SQL using LLM
-            sql_raw = llm.generate_text(prompt)
+        # (normalized query, context hash) -> generated SQL that validated and
+        # executed successfully; LRU-bounded with a TTL
+        self._sql_cache: TTLCache = TTLCache(maxsize=SQL_CACHE_SIZE, ttl=SQL_CACHE_TTL)
+        self._sql_cache_lock = threading.Lock()
+        logger.info("SQL Agent initialized")
+    
+    def _get_schema_context(self) -> str:
+        """Get database schema information for context."""
+        return _SCHEMA_CONTEXT
+    
+    @staticmethod
+    def _sql_cache_key(query: str, context: Optional[str]) -> tuple[str, str]:
+        """Build the SQL cache key from a whitespace/case-normalized query and context hash."""
+        normalized_query = " ".join(query.lower().split())
+        context_hash = hashlib.blake2b((context or "").encode('utf-8'), digest_size=8).hexdigest()
+        return normalized_query, context_hash
+    
+    def generate_sql(self, query: str, context: Optional[str] = None) -> str:
+        """
+        Convert natural language query to SQL.
+        
+        Repeated queries with the same context are served from an in-memory
+        cache of SQL that previously executed successfully (see cache_sql)
+        instead of calling the LLM again.
+        
+        Args:
+            query: Natural language query
+            context: Optional RAG context (e.g., GST rules) to inform SQL generation
             
-            # Clean up the response
-            sql_query = self._clean_sql(sql_raw)
+        Returns:
+            Generated SQL query
+        """
+        key = self._sql_cache_key(query, context)
+        with self._sql_cache_lock:
+            cached = self._sql_cache.get(key)
+        if cached is not None:
+            logger.info(f"SQL cache hit: {cached}")
+            return cached
+        
+        return self._generate_sql_uncached(query, context)
+    
+    async def agenerate_sql(self, query: str, context: Optional[str] = None) -> str:
+        """
+        Async variant of generate_sql (calls the LLM without tying up a thread).
+        
+        Args:
+            query: Natural language query
+            context: Optional RAG context (e.g., GST rules) to inform SQL generation
             
-            logger.info(f"Generated SQL: {sql_query}")
-            return sql_query
+        Returns:
+            Generated SQL query
+        """
+        key = self._sql_cache_key(query, context)
+        with self._sql_cache_lock:
+            cached = self._sql_cache.get(key)
+        if cached is not None:
+            logger.info(f"SQL cache hit: {cached}")
+            return cached
+        
+        try:
+            sql_raw = await llm.agenerate_text(self._build_prompt(query, context))
+            return self._finish_sql(sql_raw)
+        except Exception as e:
+            logger.error(f"Failed to generate SQL: {e}")
+            raise
+    
+    def cache_sql(self, query: str, context: Optional[str], sql_query: str):
+        """
+        Remember generated SQL for a query once it has validated and executed.
+        
+        Args:
+            query: Natural language query
+            context: RAG context the SQL was generated with
+            sql_query: SQL that executed successfully
+        """
+        key = self._sql_cache_key(query, context)
+        with self._sql_cache_lock:
+            # An existing entry keeps its original expiry
+            self._sql_cache.setdefault(key, sql_query)
+    
+    @staticmethod
+    def _build_prompt(query: str, context: Optional[str] = None) -> str:
+        """Build the SQL generation prompt."""
+        context_block = _CONTEXT_TEMPLATE.substitute(context=context) if context else ""
+        return _PROMPT_TEMPLATE.substitute(context_block=context_block, query=query)
+    
+    def _finish_sql(self, sql_raw: str) -> str:
+        """Clean up an LLM response and cap the result size."""
+        sql_query = self.validator.enforce_limit(self._clean_sql(sql_raw), MAX_ROWS)
+        logger.info(f"Generated SQL: {sql_query}")
+        return sql_query
+    
+    def _generate_sql_uncached(self, query: str, context: Optional[str] = None) -> str:
+        """Build the prompt and call the LLM to generate SQL."""
+        try:
+            # Generate SQL using LLM
+            sql_raw = llm.generate_text(self._build_prompt(query, context))
+            return self._finish_sql(sql_raw)
             
         except Exception as e:
             logger.error(f"Failed to generate SQL: {e}")
@@ -151,8 +242,6 @@ SQL Query:"""
     
     def _clean_sql(self, sql: str) -> str:
         """Clean and extract SQL from LLM response."""
-        import re
-        
         sql = sql.strip()
         
         # Remove markdown code blocks if present
@@ -165,7 +254,7 @@ SQL Query:"""
         
         # Remove control characters and other non-printable characters
         # Keep only printable ASCII characters, newlines, tabs, and common whitespace
-        sql = re.sub(r'[^\x20-\x7E\n\r\t]', '', sql)
+        sql = _SQL_CLEAN_RE.sub('', sql)
         
         # Remove anything after a semicolon (including the semicolon)
         # This prevents issues with extra junk after the query
@@ -175,16 +264,17 @@ SQL Query:"""
         sql = ' '.join(sql.split())
         
         # Restore proper formatting for readability (optional, but nice)
-        sql = sql.replace(' FROM ', '\nFROM ').replace(' WHERE ', '\nWHERE ').replace(' ORDER BY ', '\nORDER BY ')
+        sql = _SQL_FORMAT_RE.sub(lambda m: '\n' + m.group(1) + ' ', sql)
         
         return sql.strip()
     
-    def execute_sql(self, sql_query: str) -> tuple[bool, List[Dict[str, Any]], Optional[str]]:
+    def execute_sql(self, sql_query: str, connection=None) -> tuple[bool, List[Dict[str, Any]], Optional[str]]:
         """
         Execute SQL query after validation.
         
         Args:
             sql_query: SQL query to execute
+            connection: Optional already checked-out database connection
             
         Returns:
             Tuple of (success, results, error_message)
@@ -197,7 +287,7 @@ SQL Query:"""
         
         # Execute query
         try:
-            results = db.execute_query(sql_query)
+            results = db.execute_query(sql_query, connection=connection)
             logger.info(f"Query executed successfully. Returned {len(results)} rows")
             return True, results, None
         except Exception as e:
@@ -223,6 +313,8 @@ SQL Query:"""
             
             # Execute SQL
             success, results, error = self.execute_sql(sql_query)
+            if success:
+                self.cache_sql(natural_language_query, rag_context, sql_query)
             
             return {
                 'sql_query': sql_query,
@@ -242,6 +334,72 @@ SQL Query:"""
                 'row_count': 0
             }
     
+    async def aprocess_query(self,
+                             natural_language_query: str,
+                             rag_context: Optional[str] = None,
+                             fetch_context: bool = False) -> Dict[str, Any]:
+        """
+        Async variant of process_query that overlaps independent I/O.
+        
+        RAG retrieval (when fetch_context is set) runs concurrently with a
+        speculative database connection checkout, and that checkout stays in
+        flight while the LLM generates SQL.
+        
+        Args:
+            natural_language_query: User's question in natural language
+            rag_context: Optional context from RAG agent
+            fetch_context: Retrieve RAG context here if rag_context is not given
+            
+        Returns:
+            Dictionary with sql_query, results, success, error and the
+            rag_context that was used
+        """
+        connection_task = asyncio.create_task(db.aprefetch_connection())
+        connection = None
+        try:
+            if fetch_context and rag_context is None:
+                rag_context = await rag_agent.aretrieve_context(natural_language_query) or None
+            
+            # Generate SQL while the connection checkout completes
+            sql_query = await self.agenerate_sql(natural_language_query, rag_context)
+            
+            try:
+                connection = await connection_task
+            except Exception as e:
+                logger.warning(f"Connection prefetch failed, executing without it: {e}")
+            
+            success, results, error = await asyncio.to_thread(self.execute_sql, sql_query, connection)
+            if success:
+                self.cache_sql(natural_language_query, rag_context, sql_query)
+            
+            return {
+                'sql_query': sql_query,
+                'results': results,
+                'success': success,
+                'error': error,
+                'row_count': len(results) if success else 0,
+                'rag_context': rag_context or ''
+            }
+            
+        except Exception as e:
+            logger.error(f"Failed to process query: {e}")
+            return {
+                'sql_query': None,
+                'results': [],
+                'success': False,
+                'error': str(e),
+                'row_count': 0,
+                'rag_context': rag_context or ''
+            }
+        finally:
+            if connection is None:
+                # Don't leak a checkout that finished after we stopped waiting
+                connection_task.add_done_callback(
+                    lambda t: t.result().close() if not t.cancelled() and t.exception() is None else None
+                )
+            else:
+                connection.close()
+    
     def format_results(self, results: List[Dict[str, Any]]) -> str:
         """
         Format SQL results in a human-readable way.
@@ -255,20 +413,19 @@ SQL Query:"""
         if not results:
             return "No results found."
         
-        # Build formatted output
-        output = f"Found {len(results)} result(s):\n\n"
-        
-        for i, row in enumerate(results, 1):
-            output += f"Result {i}:\n"
+        def fmt_row(i: int, row: Dict[str, Any]) -> str:
+            lines = [f"Result {i}:"]
             for key, value in row.items():
                 # Format currency values
-                if isinstance(value, (int, float)) and key in ['total_amount', 'tax_amount', 'cgst', 'sgst', 'igst', 'unit_price']:
-                    output += f"  {key}: ₹{value:,.2f}\n"
+                if key in CURRENCY_KEYS and isinstance(value, (int, float)):
+                    lines.append(f"  {key}: ₹{value:,.2f}")
                 else:
-                    output += f"  {key}: {value}\n"
-            output += "\n"
+                    lines.append(f"  {key}: {value}")
+            return "\n".join(lines)
         
-        return output.strip()
+        return f"Found {len(results)} result(s):\n\n" + "\n\n".join(
+            fmt_row(i, row) for i, row in enumerate(results, 1)
+        )
 
 
 # Global SQL agent instance
@@ -2,39 +2,65 @@
 Configuration management.
 """
 import os
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
 from dotenv import load_dotenv
 
-# Load environment variables
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(dotenv_path=env_path)
-
-# Validate required environment variables
-# Validate required environment variables
-GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
-
-if (not GOOGLE_API_KEY or GOOGLE_API_KEY == 'your_api_key_here') and not OPENROUTER_API_KEY:
-    print("\n" + "="*60)
-    print("ERROR: No valid API Key configured!")
-    print("="*60)
-    print("\nPlease configure OPENROUTER_API_KEY or GOOGLE_API_KEY in .env")
-    print("="*60 + "\n")
-    raise ValueError("API Key not configured in .env file")
-
-# Database configuration
-DB_CONFIG = {
-    'host': os.getenv('MYSQL_HOST', 'localhost'),
-    'port': int(os.getenv('MYSQL_PORT', 3306)),
-    'database': os.getenv('MYSQL_DATABASE', 'gst_db'),
-    'user': os.getenv('MYSQL_USER', 'gst_user'),
-    'password': os.getenv('MYSQL_PASSWORD', 'gstpassword123')
-}
-
-# Rate limiting
-MAX_REQUESTS_PER_MINUTE = int(os.getenv('MAX_REQUESTS_PER_MINUTE', 60))
-
 # Paths
+ENV_PATH = Path(__file__).parent.parent / '.env'
 DATA_DIR = Path(__file__).parent.parent / 'data'
 VECTOR_STORE_PATH = DATA_DIR / 'vector_store'
 GST_RULES_PATH = DATA_DIR / 'gst_rules'
+CACHE_DIR = DATA_DIR / 'cache'
+
+
+@dataclass(frozen=True)
+class Config:
+    """Application configuration loaded from the environment."""
+    google_api_key: Optional[str]
+    openrouter_api_key: Optional[str]
+    # Read-only view, so the cached instance cannot be mutated by callers
+    db_config: Mapping[str, Any]
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """
+    Load and validate configuration (once per process).
+
+    Returns:
+        Config instance
+
+    Raises:
+        ValueError: If no valid API key is configured
+    """
+    # Load environment variables
+    load_dotenv(dotenv_path=ENV_PATH)
+
+    # Validate required environment variables
+    google_api_key = os.getenv('GOOGLE_API_KEY')
+    openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
+
+    if (not google_api_key or google_api_key == 'your_api_key_here') and not openrouter_api_key:
+        print("\n" + "="*60)
+        print("ERROR: No valid API Key configured!")
+        print("="*60)
+        print("\nPlease configure OPENROUTER_API_KEY or GOOGLE_API_KEY in .env")
+        print("="*60 + "\n")
+        raise ValueError("API Key not configured in .env file")
+
+    return Config(
+        google_api_key=google_api_key,
+        openrouter_api_key=openrouter_api_key,
+        # Database configuration
+        db_config=MappingProxyType({
+            'host': os.getenv('MYSQL_HOST', 'localhost'),
+            'port': int(os.getenv('MYSQL_PORT', 3306)),
+            'database': os.getenv('MYSQL_DATABASE', 'gst_db'),
+            'user': os.getenv('MYSQL_USER', 'gst_user'),
+            'password': os.getenv('MYSQL_PASSWORD', 'gstpassword123')
+        })
+    )
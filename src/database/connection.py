@@ -2,19 +2,25 @@
 Database connection handler for MySQL with connection pooling.
 """
 import os
+import asyncio
+import threading
 import pymysql
-from pymysql.cursors import DictCursor
+from pymysql.cursors import DictCursor, SSDictCursor
+from dbutils.pooled_db import PooledDB
 from typing import Optional, List, Dict, Any
 import logging
+from ..config import get_config
 
 logger = logging.getLogger(__name__)
 
+# Maximum rows returned by execute_query; larger results are truncated
+MAX_ROWS = int(os.getenv('MAX_QUERY_ROWS', 10000))
+
 
 class DatabaseConnection:
     """Singleton database connection manager with pooling."""
     
     _instance: Optional['DatabaseConnection'] = None
-    _connection_pool: List[pymysql.connections.Connection] = []
     
     def __new__(cls):
         if cls._instance is None:
@@ -26,67 +32,118 @@ class DatabaseConnection:
         if self._initialized:
             return
             
-        self.host = os.getenv('MYSQL_HOST', 'localhost')
-        self.port = int(os.getenv('MYSQL_PORT', 3306))
-        self.database = os.getenv('MYSQL_DATABASE', 'gst_db')
-        self.user = os.getenv('MYSQL_USER', 'gst_user')
-        self.password = os.getenv('MYSQL_PASSWORD', 'gstpassword123')
+        db_config = get_config().db_config
+        self.host = db_config['host']
+        self.port = db_config['port']
+        self.database = db_config['database']
+        self.user = db_config['user']
+        self.password = db_config['password']
+        
+        # Pool is created on first use so importing this module never touches the network
+        self._pool: Optional[PooledDB] = None
+        self._pool_lock = threading.Lock()
         self._initialized = True
         
         logger.info(f"Database connection initialized: {self.user}@{self.host}:{self.port}/{self.database}")
     
-    def get_connection(self) -> pymysql.connections.Connection:
+    def _get_pool(self) -> PooledDB:
+        """Create the connection pool on first use."""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = PooledDB(
+                        creator=pymysql,
+                        mincached=2,
+                        maxcached=10,
+                        maxconnections=20,
+                        blocking=True,
+                        ping=1,
+                        host=self.host,
+                        port=self.port,
+                        user=self.user,
+                        password=self.password,
+                        database=self.database,
+                        cursorclass=DictCursor,
+                        autocommit=False
+                    )
+                    logger.info("Database connection pool created")
+        return self._pool
+    
+    def get_connection(self):
         """
-        Get a database connection from the pool or create a new one.
+        Get a database connection from the pool.
+        
+        Calling close() on the returned connection returns it to the pool.
         
         Returns:
-            pymysql.connections.Connection: Database connection object
+            Pooled database connection object
         """
         try:
-            connection = pymysql.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                cursorclass=DictCursor,
-                autocommit=False
-            )
-            logger.debug("Database connection established")
+            connection = self._get_pool().connection()
+            logger.debug("Database connection checked out from pool")
             return connection
         except pymysql.Error as e:
             logger.error(f"Failed to connect to database: {e}")
             raise
     
-    def execute_query(self, query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
+    async def aprefetch_connection(self):
         """
-        Execute a SELECT query and return results.
+        Check out a pooled connection without blocking the event loop.
+        
+        Lets callers warm up a connection while other work (e.g. SQL
+        generation) is in flight. The caller must close() it when done.
+        
+        Returns:
+            Pooled database connection object
+        """
+        return await asyncio.to_thread(self.get_connection)
+    
+    def execute_query(self,
+                      query: str,
+                      params: Optional[tuple] = None,
+                      connection=None) -> List[Dict[str, Any]]:
+        """
+        Execute a SELECT query and return at most MAX_ROWS results.
+        
+        Rows are streamed and reading stops at MAX_ROWS, which bounds memory
+        only: closing the cursor still reads any remaining rows off the
+        wire. Bound the result on the server with a LIMIT (see
+        SQLValidator.enforce_limit) so nothing past MAX_ROWS is sent.
         
         Args:
             query: SQL SELECT query string
             params: Optional tuple of parameters for query
+            connection: Optional already checked-out connection; the caller
+                remains responsible for closing it
             
         Returns:
             List of dictionaries representing rows
         """
-        connection = None
+        owns_connection = connection is None
         try:
-            connection = self.get_connection()
-            with connection.cursor() as cursor:
+            if owns_connection:
+                connection = self.get_connection()
+            # Server-side cursor streams rows so a huge result never lands in memory at once
+            with connection.cursor(SSDictCursor) as cursor:
                 # Only pass params if they're actually provided and non-empty
                 # This prevents % in DATE_FORMAT from being interpreted as placeholders
                 if params:
                     cursor.execute(query, params)
                 else:
                     cursor.execute(query)
-                results = cursor.fetchall()
+                results = []
+                for i, row in enumerate(cursor):
+                    if i >= MAX_ROWS:
+                        logger.warning(f"Result truncated at {MAX_ROWS} rows")
+                        break
+                    results.append(row)
                 logger.debug(f"Query executed successfully. Rows returned: {len(results)}")
                 return results
         except pymysql.Error as e:
             logger.error(f"Query execution failed: {e}")
             raise
         finally:
-            if connection:
+            if owns_connection and connection:
                 connection.close()
     
     def health_check(self) -> bool:
@@ -1,17 +1,105 @@
 """
 LangGraph state machine for orchestrating agents.
 """
+import re
+import hashlib
 import operator
-from typing import Annotated, Sequence, TypedDict, Literal
+from functools import cache
+from typing import Annotated, Callable, Final, Optional, Sequence, TypedDict, Literal
+from cachetools import TTLCache
+import diskcache
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, END
 import logging
+from .config import CACHE_DIR
 from .agents.rag_agent import rag_agent
 from .agents.sql_agent import sql_agent
-from .utils.llm import llm
+from .agents.router import query_router
+from .utils.llm import llm, LLMUnavailableError
 
 logger = logging.getLogger(__name__)
 
+# Static prompt prefixes. Kept byte-identical and ahead of the variable parts
+# so providers with automatic prefix caching (OpenAI, Gemini) can reuse them.
+CLASSIFIER_PREFIX: Final[str] = """Analyze this user query and classify it into one of three categories:
+
+1. "data" - Purely factual/data questions about invoices, vendors, amounts, etc.
+   Examples: "Show me all invoices from Karnataka", "What is the total tax collected?"
+
+2. "regulatory" - Purely regulatory/legal questions about GST rules.
+   Examples: "What is Rule 86B?", "Explain input tax credit limits"
+
+3. "hybrid" - Questions that require understanding GST rules AND querying data.
+   Examples: "Show invoices violating Rule 86B", "Find transactions exceeding ITC limits"
+"""
+
+CLASSIFIER_SUFFIX: Final[str] = "Respond with ONLY one word: data, regulatory, or hybrid"
+
+SYNTHESIZER_PREFIX: Final[str] = """You are a GST compliance assistant. Provide a clear, direct, and actionable answer to the user's question.
+
+Generate a clear, direct answer following these guidelines:
+
+1. **Start with a direct answer:** Begin with "Yes" or "No" to the user's question
+2. **List violations clearly:** If violations exist, list them with:
+   - Month/Period
+   - Amount
+   - Threshold exceeded
+3. **Keep it concise:** Avoid lengthy explanations unless critical
+4. **Be actionable:** Focus on what the data shows, not what's missing
+5. **Cite rules briefly:** Reference regulations but don't over-explain
+
+For Rule 86B queries specifically:
+- If monthly totals exceed ₹50 lakhs, state "Yes, violations detected"
+- List each month with amount and excess
+- Briefly mention ITC restriction (99% limit, 1% cash payment)
+- Skip technical caveats about missing data
+"""
+
+# Top-chunk similarity above which a pure regulatory question is answered
+# straight from that chunk, without a synthesizer LLM call
+REGULATORY_FAST_PATH_SCORE = 0.85
+
+# Violation wording in synthesized answers (one scan, no lowercased copy)
+_FLAGS_RE = re.compile(r'violat|exceed', re.IGNORECASE)
+
+# Classifier/synthesizer response caches: in-memory TTL cache backed by disk
+# (the disk tier is named here and opened under CACHE_DIR on first use)
+RESPONSE_CACHE_TTL = 3600
+_cls_cache = TTLCache(maxsize=10_000, ttl=RESPONSE_CACHE_TTL)
+_synth_cache = TTLCache(maxsize=10_000, ttl=RESPONSE_CACHE_TTL)
+
+
+def _cache_key(*parts: str) -> bytes:
+    """Hash normalized text parts into a compact cache key."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\x00')
+    return h.digest()
+
+
+@cache
+def _disk_cache(name: str) -> diskcache.Cache:
+    """Open the on-disk response cache `name` (created on first use)."""
+    return diskcache.Cache(str(CACHE_DIR / name))
+
+
+def _cache_get(mem_cache: TTLCache, disk_name: str, key: bytes) -> Optional[str]:
+    """Look up a key in memory first, then on disk (promoting disk hits)."""
+    value = mem_cache.get(key)
+    if value is None:
+        value = _disk_cache(disk_name).get(key)
+        if value is not None:
+            mem_cache[key] = value
+    return value
+
+
+def _cache_set(mem_cache: TTLCache, disk_name: str, key: bytes, value: str):
+    """Store a value in both cache tiers."""
+    mem_cache[key] = value
+    _disk_cache(disk_name).set(key, value, expire=RESPONSE_CACHE_TTL)
+
 
 class AgentState(TypedDict):
     """State for the multi-agent system."""
@@ -21,11 +109,13 @@ class AgentState(TypedDict):
     sql_query: str
     sql_result: str
     rag_context: str
+    rag_top_chunk: str
+    rag_top_score: float
     final_answer: str
     compliance_flags: dict
 
 
-def classifier_node(state: AgentState) -> AgentState:
+def classifier_node(state: AgentState) -> dict:
     """
     Classify the user query to determine routing.
     
@@ -36,62 +126,60 @@ def classifier_node(state: AgentState) -> AgentState:
     """
     query = state['query']
     
-    prompt = f"""Analyze this user query and classify it into one of three categories:
-
-1. "data" - Purely factual/data questions about invoices, vendors, amounts, etc.
-   Examples: "Show me all invoices from Karnataka", "What is the total tax collected?"
-
-2. "regulatory" - Purely regulatory/legal questions about GST rules.
-   Examples: "What is Rule 86B?", "Explain input tax credit limits"
-
-3. "hybrid" - Questions that require understanding GST rules AND querying data.
-   Examples: "Show invoices violating Rule 86B", "Find transactions exceeding ITC limits"
-
-User Query: {query}
-
-Respond with ONLY one word: data, regulatory, or hybrid"""
+    key = _cache_key(query.strip().lower())
+    cached = _cache_get(_cls_cache, "classifier", key)
+    if cached is not None:
+        logger.info(f"Query classified as: {cached} (cached)")
+        return {'query_type': cached, 'messages': [AIMessage(content=f"Classified as {cached} query")]}
+    
+    prompt = f"{CLASSIFIER_PREFIX}\nUser Query: {query}\n\n{CLASSIFIER_SUFFIX}"
     
     try:
-        response = llm.generate_text(prompt).strip().lower()
+        # Keyword rules and label prototypes first; the LLM only sees ambiguous queries
+        query_type, stage = query_router.classify(query, prompt)
         
-        # Clean response
-        if "data" in response:
-            query_type = "data"
-        elif "regulatory" in response:
-            query_type = "regulatory"
-        elif "hybrid" in response:
-            query_type = "hybrid"
-        else:
-            # Default to hybrid if unclear
-            query_type = "hybrid"
+        logger.info(f"Query classified as: {query_type} (via {stage})")
+        _cache_set(_cls_cache, "classifier", key, query_type)
         
-        logger.info(f"Query classified as: {query_type}")
-        
-        state['query_type'] = query_type
-        state['messages'].append(AIMessage(content=f"Classified as {query_type} query"))
+        return {'query_type': query_type, 'messages': [AIMessage(content=f"Classified as {query_type} query")]}
         
     except Exception as e:
         logger.error(f"Classification failed: {e}")
-        state['query_type'] = "hybrid"  # Safe default
-    
-    return state
+        return {'query_type': "hybrid"}  # Safe default
 
 
-def rag_node(state: AgentState) -> AgentState:
+def rag_node(state: AgentState) -> dict:
     """Retrieve relevant GST rules context."""
     query = state['query']
     
     logger.info("Retrieving GST rules context...")
-    context = rag_agent.retrieve_context(query, k=5)
+    context, top_chunk, top_score = rag_agent.retrieve_context_scored(query, k=5)
     
-    state['rag_context'] = context
-    state['messages'].append(AIMessage(content=f"Retrieved {len(context)} chars of context"))
-    
-    logger.info(f"RAG context retrieved: {len(context)} characters")
-    return state
+    logger.info(f"RAG context retrieved: {len(context)} characters (top score {top_score:.2f})")
+    return {
+        'rag_context': context,
+        'rag_top_chunk': top_chunk,
+        'rag_top_score': top_score,
+        'messages': [AIMessage(content=f"Retrieved {len(context)} chars of context")]
+    }
+
 
+def _sql_update(result: dict) -> dict:
+    """Build the state update for an SQL agent result."""
+    if result['success']:
+        return {
+            'sql_query': result.get('sql_query', ''),
+            'sql_result': sql_agent.format_results(result['results']),
+            'messages': [AIMessage(content=f"Query executed: {result['row_count']} rows")]
+        }
+    return {
+        'sql_query': result.get('sql_query', ''),
+        'sql_result': f"Error: {result['error']}",
+        'messages': [AIMessage(content=f"Query failed: {result['error']}")]
+    }
 
-def sql_node(state: AgentState) -> AgentState:
+
+def sql_node(state: AgentState) -> dict:
     """Generate and execute SQL query."""
     query = state['query']
     rag_context = state.get('rag_context', '')
@@ -101,121 +189,155 @@ def sql_node(state: AgentState) -> AgentState:
     # Use RAG context if available (for hybrid queries)
     result = sql_agent.process_query(query, rag_context if rag_context else None)
     
-    state['sql_query'] = result.get('sql_query', '')
+    logger.info(f"SQL execution complete. Success: {result['success']}")
+    return _sql_update(result)
+
+
+def _rag_sql_update(result: dict, context: str) -> dict:
+    """Build the state update for a hybrid retrieval + SQL result."""
+    update = _sql_update(result)
+    update['rag_context'] = context
+    update['messages'].insert(0, AIMessage(content=f"Retrieved {len(context)} chars of context"))
+    logger.info(f"Hybrid retrieval and SQL complete. Success: {result['success']}")
+    return update
+
+
+def rag_sql_node(state: AgentState) -> dict:
+    """Retrieve GST rules context, then run SQL informed by it (hybrid queries)."""
+    query = state['query']
     
-    if result['success']:
-        # Format results
-        formatted = sql_agent.format_results(result['results'])
-        state['sql_result'] = formatted
-        state['messages'].append(AIMessage(content=f"Query executed: {result['row_count']} rows"))
-    else:
-        state['sql_result'] = f"Error: {result['error']}"
-        state['messages'].append(AIMessage(content=f"Query failed: {result['error']}"))
+    logger.info("Retrieving GST rules context and processing SQL query...")
+    context = rag_agent.retrieve_context(query)
+    result = sql_agent.process_query(query, context if context else None)
+    return _rag_sql_update(result, context)
+
+
+async def arag_sql_node(state: AgentState) -> dict:
+    """
+    Async variant of rag_sql_node, used by ainvoke/abatch.
     
-    logger.info(f"SQL execution complete. Success: {result['success']}")
-    return state
+    SQL generation depends on the retrieved rules, so retrieval runs
+    concurrently with the speculative database connection checkout instead
+    of as a separate graph step.
+    """
+    query = state['query']
+    
+    logger.info("Retrieving GST rules context and processing SQL query...")
+    result = await sql_agent.aprocess_query(query, fetch_context=True)
+    return _rag_sql_update(result, result.get('rag_context', ''))
+
+
+def _regulatory_template(top_chunk: str) -> str:
+    """Templated answer quoting the best-matching rules chunk."""
+    return f"According to the GST rules:\n\n{top_chunk}"
+
+
+def _compliance_flags(answer: str, rag_context: str, sql_result: str) -> dict:
+    """Extract compliance flags from a final answer."""
+    return {
+        'has_violations': bool(_FLAGS_RE.search(answer)),
+        'regulatory_cited': bool(rag_context),
+        'data_analyzed': bool(sql_result)
+    }
 
 
-def synthesizer_node(state: AgentState) -> AgentState:
+def synthesizer_node(state: AgentState, config: RunnableConfig) -> dict:
     """
     Synthesize final answer from all available context.
+    
+    If an `on_token` callback is passed in config["configurable"], the answer
+    is streamed to it as it is generated.
     """
+    on_token: Optional[Callable[[str], None]] = config.get('configurable', {}).get('on_token')
     query = state['query']
     query_type = state['query_type']
     rag_context = state.get('rag_context', '')
     sql_result = state.get('sql_result', '')
     sql_query = state.get('sql_query', '')
     
-    # Build synthesis prompt
-    prompt = f"""You are a GST compliance assistant. Provide a clear, direct, and actionable answer to the user's question.
-
-User Question: {query}
-
-"""
+    # Fast path: a pure regulatory question with a near-exact rules match is
+    # answered from that chunk directly
+    top_chunk = state.get('rag_top_chunk', '')
+    if (query_type == "regulatory" and not sql_result and top_chunk
+            and state.get('rag_top_score', 0.0) > REGULATORY_FAST_PATH_SCORE):
+        answer = _regulatory_template(top_chunk)
+        if on_token:
+            on_token(answer)
+        logger.info("Answered from top rules chunk (synthesizer skipped)")
+        return {
+            'final_answer': answer,
+            'compliance_flags': _compliance_flags(answer, rag_context, sql_result),
+            'messages': [AIMessage(content="Final answer taken from top rules chunk")]
+        }
+    
+    # Build synthesis prompt (static instructions first for provider prefix caching)
+    parts = [f"{SYNTHESIZER_PREFIX}\nUser Question: {query}\n\n"]
     
     if rag_context:
-        prompt += f"""Relevant GST Rules:
-{rag_context}
-
-"""
+        parts.append(f"Relevant GST Rules:\n{rag_context}\n\n")
     
     if sql_result:
-        prompt += f"""Database Query Results:
-{sql_result}
-
-SQL Query Used: {sql_query}
-
-"""
+        parts.append(f"Database Query Results:\n{sql_result}\n\nSQL Query Used: {sql_query}\n\n")
     
-    prompt += """Generate a clear, direct answer following these guidelines:
-
-1. **Start with a direct answer:** Begin with "Yes" or "No" to the user's question
-2. **List violations clearly:** If violations exist, list them with:
-   - Month/Period
-   - Amount
-   - Threshold exceeded
-3. **Keep it concise:** Avoid lengthy explanations unless critical
-4. **Be actionable:** Focus on what the data shows, not what's missing
-5. **Cite rules briefly:** Reference regulations but don't over-explain
-
-For Rule 86B queries specifically:
-- If monthly totals exceed ₹50 lakhs, state "Yes, violations detected"
-- List each month with amount and excess
-- Briefly mention ITC restriction (99% limit, 1% cash payment)
-- Skip technical caveats about missing data
-
-Answer:"""
+    parts.append("Answer:")
+    prompt = ''.join(parts)
     
     try:
-        answer = llm.generate_text(prompt)
-        
-        # Ensure answer is a string (handle cases where LLM might return a list or other type)
-        if isinstance(answer, list):
-            answer = ' '.join(str(item) for item in answer)
-        elif not isinstance(answer, str):
-            answer = str(answer)
-        
-        state['final_answer'] = answer
-        
-        # Extract compliance flags
-        compliance_flags = {
-            'has_violations': 'violation' in answer.lower() or 'exceed' in answer.lower(),
-            'regulatory_cited': bool(rag_context),
-            'data_analyzed': bool(sql_result)
-        }
-        state['compliance_flags'] = compliance_flags
+        key = _cache_key(query.strip().lower(), rag_context, sql_result)
+        answer = _cache_get(_synth_cache, "synthesizer", key)
+        if answer is None:
+            # Paraphrased questions may share an answer, but only given the same evidence
+            semantic = {
+                'semantic_key': query,
+                'cache_namespace': "synthesizer:" + _cache_key(rag_context, sql_result).hex(),
+            }
+            if on_token:
+                parts = []
+                for token in llm.generate_text_stream(prompt, **semantic):
+                    parts.append(token)
+                    on_token(token)
+                answer = ''.join(parts)
+            else:
+                answer = llm.generate_text(prompt, **semantic)
+            
+            # Ensure answer is a string (handle cases where LLM might return a list or other type)
+            if isinstance(answer, list):
+                answer = ' '.join(str(item) for item in answer)
+            elif not isinstance(answer, str):
+                answer = str(answer)
+            _cache_set(_synth_cache, "synthesizer", key, answer)
+        elif on_token:
+            on_token(answer)
         
-        state['messages'].append(AIMessage(content="Final answer synthesized"))
         logger.info("Answer synthesized successfully")
+        return {
+            'final_answer': answer,
+            'compliance_flags': _compliance_flags(answer, rag_context, sql_result),
+            'messages': [AIMessage(content="Final answer synthesized")]
+        }
         
+    except LLMUnavailableError as e:
+        # Stand-in answer while the provider is down; deliberately not cached
+        logger.warning("Synthesis skipped: LLM unavailable")
+        if on_token:
+            on_token(e.fallback)
+        return {'final_answer': e.fallback, 'compliance_flags': {}}
+    
     except Exception as e:
         logger.error(f"Synthesis failed: {e}")
-        state['final_answer'] = f"Error synthesizing answer: {e}"
-        state['compliance_flags'] = {}
-    
-    return state
+        return {'final_answer': f"Error synthesizing answer: {e}", 'compliance_flags': {}}
 
 
-def route_after_classifier(state: AgentState) -> Literal["rag_node", "sql_node"]:
+def route_after_classifier(state: AgentState) -> Literal["rag_node", "sql_node", "rag_sql_node"]:
     """Determine next node after classification."""
     query_type = state.get('query_type', 'hybrid')
     
     if query_type == "data":
         return "sql_node"
-    else:  # regulatory or hybrid
+    elif query_type == "regulatory":
         return "rag_node"
-
-
-def route_after_rag(state: AgentState) -> Literal["sql_node", "synthesizer_node"]:
-    """Determine next node after RAG."""
-    query_type = state.get('query_type', 'hybrid')
-    
-    if query_type == "regulatory":
-        # Pure regulatory query, go straight to synthesis
-        return "synthesizer_node"
     else:  # hybrid
-        # Need to query SQL with RAG context
-        return "sql_node"
+        return "rag_sql_node"
 
 
 def create_graph() -> StateGraph:
@@ -227,7 +349,10 @@ def create_graph() -> StateGraph:
     2. Routes based on type:
        - data: -> SQL -> Synthesizer
        - regulatory: -> RAG -> Synthesizer
-       - hybrid: -> RAG -> SQL -> Synthesizer
+       - hybrid: -> RAG + SQL (overlapped) -> Synthesizer
+    
+    The hybrid node has sync and async implementations, so the graph runs
+    with invoke/batch as well as ainvoke/abatch (which overlap more I/O).
     """
     workflow = StateGraph(AgentState)
     
@@ -235,6 +360,7 @@ def create_graph() -> StateGraph:
     workflow.add_node("classifier_node", classifier_node)
     workflow.add_node("rag_node", rag_node)
     workflow.add_node("sql_node", sql_node)
+    workflow.add_node("rag_sql_node", RunnableLambda(func=rag_sql_node, afunc=arag_sql_node))
     workflow.add_node("synthesizer_node", synthesizer_node)
     
     # Set entry point
@@ -246,21 +372,15 @@ def create_graph() -> StateGraph:
         route_after_classifier,
         {
             "rag_node": "rag_node",
-            "sql_node": "sql_node"
-        }
-    )
-    
-    workflow.add_conditional_edges(
-        "rag_node",
-        route_after_rag,
-        {
             "sql_node": "sql_node",
-            "synthesizer_node": "synthesizer_node"
+            "rag_sql_node": "rag_sql_node"
         }
     )
     
-    # SQL always goes to synthesizer
+    # Every retrieval/SQL node goes to synthesizer
+    workflow.add_edge("rag_node", "synthesizer_node")
     workflow.add_edge("sql_node", "synthesizer_node")
+    workflow.add_edge("rag_sql_node", "synthesizer_node")
     
     # Synthesizer is the end
     workflow.add_edge("synthesizer_node", END)
@@ -3,12 +3,13 @@ Main CLI interface for the Multi-Agent GST system.
 """
 import sys
 import json
+import asyncio
+import argparse
 from pathlib import Path
+from typing import Callable, Optional, Union
 from colorama import Fore, Style, init
 from langchain_core.messages import HumanMessage
-from src.graph import graph
 from src.utils.logger import setup_logger
-from src.database.connection import db
 
 # Initialize colorama for Windows
 init(autoreset=True)
@@ -68,46 +69,132 @@ def print_answer(answer: str):
     print(f"{Fore.GREEN}{answer}{Style.RESET_ALL}")
 
 
+class TokenPrinter:
+    """Prints streamed answer tokens, buffering to avoid a write per token."""
+    
+    def __init__(self, flush_every: int = 8):
+        self.flush_every = flush_every
+        self._buffer: list[str] = []
+        self.started = False
+    
+    def __call__(self, token: str):
+        if not self.started:
+            print_section_header("ANSWER")
+            sys.stdout.write(Fore.GREEN)
+            self.started = True
+        self._buffer.append(token)
+        if len(self._buffer) >= self.flush_every or '\n' in token:
+            self.flush()
+    
+    def flush(self):
+        """Write buffered tokens to stdout."""
+        if self._buffer:
+            sys.stdout.write(''.join(self._buffer))
+            self._buffer.clear()
+        sys.stdout.flush()
+    
+    def close(self):
+        """Flush remaining tokens and reset colors."""
+        if self.started:
+            self.flush()
+            print(Style.RESET_ALL)
+
+
 def print_json_output(data: dict):
     """Print JSON output in a formatted way."""
     json_str = json.dumps(data, indent=2, default=str)
     print(f"{Fore.CYAN}{json_str}{Style.RESET_ALL}")
 
 
-def run_query(user_query: str) -> dict:
-    """
-    Run a query through the multi-agent system.
-    
-    Args:
-        user_query: User's question
-        
-    Returns:
-        Dictionary with results
-    """
-    # Initialize state
-    initial_state = {
+def initial_state(user_query: str) -> dict:
+    """Build the initial graph state for a query."""
+    return {
         'messages': [HumanMessage(content=user_query)],
         'query': user_query,
         'query_type': '',
         'sql_query': '',
         'sql_result': '',
         'rag_context': '',
+        'rag_top_chunk': '',
+        'rag_top_score': 0.0,
         'final_answer': '',
         'compliance_flags': {}
     }
+
+
+def run_query(user_query: str, on_token: Optional[Callable[[str], None]] = None) -> dict:
+    """
+    Run a query through the multi-agent system.
+    
+    Args:
+        user_query: User's question
+        on_token: Optional callback receiving the final answer as it streams
+        
+    Returns:
+        Dictionary with results
+    """
+    from src.graph import graph
     
     # Run through graph
     logger.info(f"Processing query: {user_query}")
-    result = graph.invoke(initial_state)
+    config = {'configurable': {'on_token': on_token}} if on_token else None
+    # Sync invoke, so this also works when called from a running event loop
+    result = graph.invoke(initial_state(user_query), config=config)
     
     return result
 
 
+def run_queries(queries: list[str], max_concurrency: int = 16) -> list[Union[dict, Exception]]:
+    """
+    Run many queries through the multi-agent system concurrently.
+    
+    A query that fails does not affect the others: its slot holds the
+    exception instead of a result.
+    
+    Args:
+        queries: User questions
+        max_concurrency: Maximum queries in flight at once
+        
+    Returns:
+        List of result dictionaries (or exceptions), in the same order as queries
+    """
+    from src.graph import graph
+    
+    logger.info(f"Processing {len(queries)} queries in batch")
+    states = [initial_state(query) for query in queries]
+    results = asyncio.run(graph.abatch(
+        states, config={'max_concurrency': max_concurrency}, return_exceptions=True
+    ))
+    for query, result in zip(queries, results):
+        if isinstance(result, Exception):
+            logger.error(f"Query failed: {query}: {result}")
+    return results
+
+
+def batch_mode(input_file: str):
+    """Answer every query in a file (one per line), printing JSON lines."""
+    queries = [line.strip() for line in Path(input_file).read_text(encoding='utf-8').splitlines()]
+    queries = [query for query in queries if query]
+    
+    for query, result in zip(queries, run_queries(queries)):
+        if isinstance(result, Exception):
+            print(json.dumps({'query': query, 'error': str(result)}))
+            continue
+        print(json.dumps({
+            'query': query,
+            'query_type': result.get('query_type', ''),
+            'answer': result['final_answer'],
+            'compliance_flags': result.get('compliance_flags', {}),
+            'sql_executed': result.get('sql_query', '')
+        }, default=str))
+
+
 def interactive_mode():
     """Run the CLI in interactive mode."""
     print_banner()
     
     # Check database connection
+    from src.database.connection import db
     print(f"{Fore.YELLOW}Checking database connection...{Style.RESET_ALL}")
     if db.health_check():
         print(f"{Fore.GREEN}✓ Database connected successfully{Style.RESET_ALL}\n")
@@ -146,11 +233,16 @@ def interactive_mode():
             # Process query
             print(f"\n{Fore.CYAN}Processing...{Style.RESET_ALL}\n")
             
-            result = run_query(user_input)
+            printer = TokenPrinter()
+            try:
+                result = run_query(user_input, on_token=printer)
+            finally:
+                printer.close()
             
-            # Display results
-            print_section_header("ANSWER")
-            print_answer(result['final_answer'])
+            # Display results (already shown if the answer was streamed)
+            if not printer.started:
+                print_section_header("ANSWER")
+                print_answer(result['final_answer'])
             
             # Show SQL query if executed
             if result.get('sql_query'):
@@ -181,12 +273,20 @@ def interactive_mode():
 
 def main():
     """Main entry point."""
+    parser = argparse.ArgumentParser(description="Multi-Agent GST & Invoice Orchestration System")
+    parser.add_argument('--input-file', help="Answer the queries in this file (one per line) and exit")
+    args = parser.parse_args()
+    
     try:
-        # Import config to validate environment
-        from src import config
+        # Load config to validate environment
+        from src.config import get_config
+        get_config()
         
-        # Run interactive mode
-        interactive_mode()
+        if args.input_file:
+            batch_mode(args.input_file)
+        else:
+            # Run interactive mode
+            interactive_mode()
         
     except ValueError as e:
         # Configuration error (e.g., missing API key)
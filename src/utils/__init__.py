@@ -1,6 +1,23 @@
 """Utilities package initialization."""
 from .logger import setup_logger
-from .llm import llm, GeminiLLM
-from .security import SQLValidator, rate_limiter
 
-__all__ = ['setup_logger', 'llm', 'GeminiLLM', 'SQLValidator', 'rate_limiter']
+# Resolved on first access: importing these builds the LLM client and rate
+# limiter from the environment, which must wait until .env is loaded.
+# (The global `llm` instance is not re-exported here because the name is
+# shadowed by the `llm` submodule; use `from src.utils.llm import llm`.)
+_LAZY_EXPORTS = {
+    'get_llm': '.llm',
+    'GeminiLLM': '.llm',
+    'SQLValidator': '.security',
+    'rate_limiter': '.security',
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_EXPORTS:
+        from importlib import import_module
+        return getattr(import_module(_LAZY_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ['setup_logger', 'get_llm', 'GeminiLLM', 'SQLValidator', 'rate_limiter']
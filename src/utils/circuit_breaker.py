@@ -0,0 +1,83 @@
+"""
+Circuit breaker for calls to external providers.
+"""
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Minimal closed/open/half-open circuit breaker.
+
+    After `fail_max` consecutive failures the circuit opens and calls are
+    rejected for `reset_timeout` seconds; then a single trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str, fail_max: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize circuit breaker.
+
+        Args:
+            name: Name used in log messages (e.g. provider name)
+            fail_max: Consecutive failures before opening
+            reset_timeout: Seconds to stay open before a trial call
+        """
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Current state: "closed", "open" or "half-open"."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed now."""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        """Record a successful call (closes the circuit)."""
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit '{self.name}' closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """End a half-open trial without recording an outcome (no-op otherwise)."""
+        with self.lock:
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        """Record a failed call (may open the circuit)."""
+        with self.lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.fail_max:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit '{self.name}' opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
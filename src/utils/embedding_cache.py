@@ -0,0 +1,166 @@
+"""
+Persistent on-disk cache for embedding vectors.
+"""
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from functools import cache
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from src.config import DATA_DIR
+
+try:
+    from blake3 import blake3 as _content_hash
+except ImportError:  # pragma: no cover - blake3 is optional
+    _content_hash = hashlib.sha256
+
+logger = logging.getLogger(__name__)
+
+
+def quantize_int8(vec: list[float]) -> tuple[bytes, float]:
+    """
+    Symmetrically quantize a vector to int8 with a single per-vector scale.
+
+    Returns:
+        Tuple of (int8 bytes, scale)
+    """
+    v = np.asarray(vec, dtype=np.float32)
+    scale = float(np.abs(v).max()) / 127.0 or 1.0
+    q = np.clip(np.round(v / scale), -127, 127).astype(np.int8)
+    return q.tobytes(), scale
+
+
+def dequantize_int8(blob: bytes, scale: float) -> list[float]:
+    """Restore an FP32 vector from int8 bytes and its scale."""
+    return (np.frombuffer(blob, dtype=np.int8).astype(np.float32) * scale).tolist()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache keyed by a hash of (model, text)."""
+
+    def __init__(self, db_path: str = "./data/embedding_cache.db", quantize: bool = False):
+        """
+        Initialize embedding cache.
+
+        Args:
+            db_path: Path to the SQLite database file
+            quantize: Store vectors as int8 (4x smaller) instead of FP32
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.quantize = quantize
+
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS emb (hash TEXT PRIMARY KEY, model TEXT, vec BLOB)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS emb_int8 "
+            "(hash TEXT PRIMARY KEY, model TEXT, scale REAL, vec BLOB)"
+        )
+        self.conn.commit()
+        self.lock = threading.Lock()
+
+        logger.info(f"Embedding cache initialized: {self.db_path} (int8={quantize})")
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """
+        Build the cache key for a text embedded with a given model.
+
+        Uses blake3 (SIMD-accelerated) when installed, otherwise SHA-256.
+        """
+        return _content_hash(f"{model}:{text}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[list[float]]:
+        """
+        Look up a cached embedding.
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            Embedding vector (dequantized if stored as int8), or None on a miss
+        """
+        with self.lock:
+            if self.quantize:
+                row = self.conn.execute(
+                    "SELECT vec, scale FROM emb_int8 WHERE hash = ?", (key,)
+                ).fetchone()
+            else:
+                row = self.conn.execute("SELECT vec FROM emb WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self.quantize:
+            return dequantize_int8(row[0], row[1])
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def _row(self, key: str, model: str, vec: list[float]) -> tuple:
+        """Build the table row for an embedding in the configured format."""
+        if self.quantize:
+            blob, scale = quantize_int8(vec)
+            return (key, model, scale, blob)
+        return (key, model, np.asarray(vec, dtype=np.float32).tobytes())
+
+    @property
+    def _insert_sql(self) -> str:
+        if self.quantize:
+            return "INSERT OR REPLACE INTO emb_int8 (hash, model, scale, vec) VALUES (?, ?, ?, ?)"
+        return "INSERT OR REPLACE INTO emb (hash, model, vec) VALUES (?, ?, ?)"
+
+    def put(self, key: str, vec: list[float], model: str = ""):
+        """
+        Store an embedding.
+
+        Args:
+            key: Cache key from make_key
+            vec: Embedding vector
+            model: Embedding model name (informational)
+        """
+        row = self._row(key, model, vec)
+        with self.lock:
+            self.conn.execute(self._insert_sql, row)
+            self.conn.commit()
+
+    def put_many(self, model: str, texts: list[str], vectors: list[list[float]]):
+        """Store embeddings for several texts in one transaction."""
+        rows = [
+            self._row(self.make_key(model, text), model, vec)
+            for text, vec in zip(texts, vectors)
+        ]
+        with self.lock:
+            self.conn.executemany(self._insert_sql, rows)
+            self.conn.commit()
+
+    def find_uncached_texts(self, model: str, texts: list[str]) -> tuple[dict[int, list[float]], list[int]]:
+        """
+        Partition texts into cached and uncached.
+
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+
+        Returns:
+            Tuple of (cached vectors by index, indices of uncached texts)
+        """
+        cached = {}
+        uncached = []
+        for i, text in enumerate(texts):
+            vec = self.get(self.make_key(model, text))
+            if vec is None:
+                uncached.append(i)
+            else:
+                cached[i] = vec
+        return cached, uncached
+
+
+@cache
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide EmbeddingCache (the database is opened on first call)."""
+    return EmbeddingCache(
+        os.getenv('EMBEDDING_CACHE_PATH', str(DATA_DIR / 'embedding_cache.db')),
+        quantize=os.getenv('EMBEDDING_CACHE_INT8', 'false').lower() == 'true'
+    )
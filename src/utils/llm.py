@@ -2,15 +2,78 @@
 Gemini LLM initialization and wrapper using LangChain.
 """
 import os
-from typing import Optional
+import asyncio
+import threading
+import weakref
+from functools import cache
+from typing import Iterator, Optional
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from src.utils.security import rate_limiter
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception, RetryError
+from src.config import get_config
+from src.utils.security import rate_limiter, async_rate_limiter
+from src.utils.embedding_cache import get_embedding_cache
+from src.utils.semantic_cache import SemanticCache
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of texts each provider accepts in a single embedding request
+GOOGLE_MAX_EMBED_BATCH = 100
+OPENAI_MAX_EMBED_BATCH = 2048
+
+# Shown when the provider circuit is open and nothing is cached
+FALLBACK_RESPONSE = "The language model is temporarily unavailable. Please try again shortly."
+
+# HTTP status codes worth retrying; other 4xx errors fail fast
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailableError(CircuitOpenError):
+    """
+    Raised by generate_text when the provider circuit is open.
+    
+    `fallback` is a stand-in answer for the user (the nearest cached response
+    or FALLBACK_RESPONSE); it is not an answer to the prompt, so never cache it.
+    """
+    
+    def __init__(self, fallback: str):
+        super().__init__(fallback)
+        self.fallback = fallback
+
+
+def _is_transient_error(error: BaseException) -> bool:
+    """Return True for errors worth retrying (rate limits, 5xx, timeouts, connection errors)."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    if isinstance(status, int):
+        return status in TRANSIENT_STATUS_CODES
+    message = str(error).lower()
+    return any(marker in message for marker in (
+        '429', '500', '502', '503', '504', 'rate limit', 'resource_exhausted',
+        'unavailable', 'timeout', 'timed out', 'connection'
+    ))
+
+
+# Jittered exponential backoff, retrying only transient errors
+retry_transient = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_random_exponential(multiplier=1, max=10),
+    retry=retry_if_exception(_is_transient_error),
+    reraise=True
+)
+
+# Maximum async provider calls in flight at once
+MAX_CONCURRENT_REQUESTS = 16
+
+# Optional override (lower) for texts per embedding request
+EMBED_MAX_BATCH_SIZE = int(os.getenv('EMBED_MAX_BATCH_SIZE', 0))
+
+# Cosine similarity above which a cached LLM response is reused (0 disables)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0))
+
 
 class GeminiLLM:
     """Wrapper for LLM (Google Gemini or OpenRouter) with rate limiting."""
@@ -28,11 +91,18 @@ class GeminiLLM:
             return
         
         # Check for OpenRouter configuration first
-        openrouter_key = os.getenv('OPENROUTER_API_KEY')
-        google_api_key = os.getenv('GOOGLE_API_KEY')
+        config = get_config()
+        openrouter_key = config.openrouter_api_key
+        google_api_key = config.google_api_key
+        
+        # Trips after repeated transient failures so callers stop hammering the provider
+        self.breaker = CircuitBreaker("openrouter" if openrouter_key else "google")
         
         # 1. Initialize LLM (The "Brain")
+        # Provider packages are imported only for the configured provider
+        self.max_embed_batch = GOOGLE_MAX_EMBED_BATCH
         if openrouter_key:
+            from langchain_openai import ChatOpenAI
             model_name = os.getenv('OPENROUTER_MODEL', 'google/gemini-2.0-flash-001')
             logger.info(f"Using OpenRouter LLM: {model_name}")
             
@@ -43,6 +113,7 @@ class GeminiLLM:
                 temperature=0.1
             )
         elif google_api_key:
+            from langchain_google_genai import ChatGoogleGenerativeAI
             logger.info("Using Google Gemini Direct API")
             self.model = ChatGoogleGenerativeAI(
                 model="gemini-flash-latest",
@@ -55,71 +126,318 @@ class GeminiLLM:
              raise ValueError("No API Key found! Please set OPENROUTER_API_KEY or GOOGLE_API_KEY in .env")
 
         # 2. Initialize Embeddings (The "Memory")
+        # Clients are constructed here; the live probe is deferred to first use
+        self._embeddings_validated = False
+        self._embeddings_lock = threading.Lock()
         try:
             if openrouter_key:
+                from langchain_openai import OpenAIEmbeddings
                 logger.info("Using OpenRouter for Embeddings (via OpenAI-compatible endpoint)")
                 # Standard model usually supported by OpenRouter's forwarding
                 # Ensure the provider supports this or use a generic one if routed
                 emb_model = "text-embedding-3-small" 
-                self.embeddings = OpenAIEmbeddings(
+                self._embedding_model = emb_model
+                self.max_embed_batch = OPENAI_MAX_EMBED_BATCH
+                self._embeddings = OpenAIEmbeddings(
                     model=emb_model,
                     openai_api_key=openrouter_key,
                     openai_api_base="https://openrouter.ai/api/v1"
                 )
-                self.embeddings.embed_query("test")
                 
             elif google_api_key:
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
                 # User suggested model for deprecated text-embedding-004
                 model_name = "models/gemini-embedding-001"
                 logger.info(f"Using Google Embeddings: {model_name}")
-                self.embeddings = GoogleGenerativeAIEmbeddings(
+                self._embedding_model = model_name
+                self._embeddings = GoogleGenerativeAIEmbeddings(
                     model=model_name,
                     google_api_key=google_api_key
                 )
-                self.embeddings.embed_query("test")
             else:
                 raise ValueError("No API key available for embeddings")
                 
         except Exception as e:
-            logger.error(f"Failed to initialize embeddings: {e}")
-            logger.warning("Falling back to FakeEmbeddings (RAG will not be accurate)")
-            from langchain_community.embeddings import FakeEmbeddings
-            self.embeddings = FakeEmbeddings(size=768)
+            self._use_fake_embeddings(e)
+        
+        # Per-event-loop semaphores bounding concurrent async provider calls
+        self._semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        
+        # Semantic response cache (skipped at use time if embeddings are fake)
+        self.response_cache = None
+        if SEMANTIC_CACHE_THRESHOLD > 0:
+            self.response_cache = SemanticCache(threshold=SEMANTIC_CACHE_THRESHOLD)
+        
+        if EMBED_MAX_BATCH_SIZE > 0:
+            self.max_embed_batch = min(self.max_embed_batch, EMBED_MAX_BATCH_SIZE)
         
         self._initialized = True
         logger.info("Gemini LLM initialized successfully with LangChain")
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    def generate_text(self, prompt: str) -> str:
+    def _use_fake_embeddings(self, error: Exception):
+        """Fall back to FakeEmbeddings after an embeddings setup/probe failure."""
+        logger.error(f"Failed to initialize embeddings: {error}")
+        logger.warning("Falling back to FakeEmbeddings (RAG will not be accurate)")
+        from langchain_community.embeddings import FakeEmbeddings
+        self._embeddings = FakeEmbeddings(size=768)
+        self._embedding_model = "fake-768"
+        self._embeddings_validated = True
+    
+    def _validate_embeddings(self):
+        """Probe the embeddings endpoint once, on first use."""
+        if self._embeddings_validated:
+            return
+        with self._embeddings_lock:
+            if self._embeddings_validated:
+                return
+            try:
+                self._embeddings.embed_query("test")
+                self._embeddings_validated = True
+            except Exception as e:
+                self._use_fake_embeddings(e)
+    
+    @property
+    def embeddings(self):
+        """Embeddings client (validated on first access)."""
+        self._validate_embeddings()
+        return self._embeddings
+    
+    @property
+    def embedding_model(self) -> str:
+        """Name of the active embedding model (validated on first access)."""
+        self._validate_embeddings()
+        return self._embedding_model
+    
+    def generate_text(self, prompt: str, semantic_key: Optional[str] = None, cache_namespace: str = "") -> str:
         """
         Generate text using Gemini with rate limiting and retry logic.
         
+        When SEMANTIC_CACHE_THRESHOLD is set, identical prompts are answered
+        from the response cache. Callers that pass a semantic_key (the variable
+        part of their prompt) also get answers cached for similar keys in the
+        same cache_namespace.
+        
         Args:
             prompt: Input prompt
+            semantic_key: Text matched by similarity instead of the whole prompt
+            cache_namespace: Scope for similarity matches (one per prompt template)
             
         Returns:
             Generated text
+            
+        Raises:
+            LLMUnavailableError: If the provider circuit is open
         """
+        cached, emb = self._cached_response(prompt, semantic_key, cache_namespace)
+        if cached is not None:
+            logger.debug(f"Response cache hit for prompt: {prompt[:100]}...")
+            return cached
+        
+        try:
+            content = self._generate_text_uncached(prompt)
+        except CircuitOpenError as e:
+            raise LLMUnavailableError(self._fallback_response(emb, cache_namespace)) from e
+        
+        if self.response_cache is not None:
+            self.response_cache.put(prompt, content, emb, cache_namespace)
+        return content
+    
+    def _semantic_enabled(self, semantic_key: Optional[str]) -> bool:
+        """Whether similarity matching applies (FakeEmbeddings are random, so never with them)."""
+        return semantic_key is not None and not self.embedding_model.startswith("fake")
+    
+    def _cached_response(self, prompt: str, semantic_key: Optional[str], namespace: str):
+        """Look up the response cache; returns (cached response or None, key embedding or None)."""
+        if self.response_cache is None:
+            return None, None
+        if not self._semantic_enabled(semantic_key):
+            semantic_key = None
+        return self.response_cache.lookup(prompt, self.generate_embedding, semantic_key, namespace)
+    
+    def _fallback_response(self, emb=None, namespace: str = "") -> str:
+        """Answer served while the provider circuit is open."""
+        logger.warning("LLM circuit open; serving fallback response")
+        if self.response_cache is not None and emb is not None:
+            nearest = self.response_cache.nearest(emb, namespace)
+            if nearest is not None:
+                return nearest
+        return FALLBACK_RESPONSE
+    
+    def _call_with_breaker(self, fn, *args):
+        """Run a provider call through the circuit breaker."""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit '{self.breaker.name}' is open")
+        try:
+            result = fn(*args)
+        except Exception as e:
+            if _is_transient_error(e):
+                self.breaker.record_failure()
+            raise
+        else:
+            self.breaker.record_success()
+            return result
+        finally:
+            # Non-transient errors and cancellation say nothing about provider
+            # health, but must not leave a half-open trial claimed forever
+            self.breaker.release()
+    
+    @retry_transient
+    def _generate_text_uncached(self, prompt: str) -> str:
+        """Call the chat model directly (rate limited, with retries)."""
         # Apply rate limiting
         rate_limiter.wait_if_needed()
         
         try:
-            response = self.model.invoke(prompt)
+            response = self._call_with_breaker(self.model.invoke, prompt)
             logger.debug(f"Generated response for prompt: {prompt[:100]}...")
             
             # Ensure we always return a string
-            content = response.content
-            if isinstance(content, list):
-                content = ' '.join(str(item) for item in content)
-            elif not isinstance(content, str):
-                content = str(content)
-            
-            return content
+            return self._content_to_text(response.content)
         except Exception as e:
             logger.error(f"Failed to generate text: {e}")
             raise
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    async def agenerate_text(self, prompt: str, semantic_key: Optional[str] = None, cache_namespace: str = "") -> str:
+        """
+        Async variant of generate_text (uses the model's ainvoke).
+        
+        Args:
+            prompt: Input prompt
+            semantic_key: Text matched by similarity instead of the whole prompt
+            cache_namespace: Scope for similarity matches (one per prompt template)
+            
+        Returns:
+            Generated text
+            
+        Raises:
+            LLMUnavailableError: If the provider circuit is open
+        """
+        emb = None
+        if self.response_cache is not None:
+            cached = self.response_cache.get_exact(prompt)
+            if cached is None and self._semantic_enabled(semantic_key):
+                key_emb = await self.agenerate_embedding(semantic_key)
+                cached, emb = self.response_cache.match(key_emb, cache_namespace)
+            if cached is not None:
+                logger.debug(f"Response cache hit for prompt: {prompt[:100]}...")
+                return cached
+        
+        try:
+            content = await self._agenerate_text_uncached(prompt)
+        except CircuitOpenError as e:
+            raise LLMUnavailableError(self._fallback_response(emb, cache_namespace)) from e
+        
+        if self.response_cache is not None:
+            self.response_cache.put(prompt, content, emb, cache_namespace)
+        return content
+    
+    @retry_transient
+    async def _agenerate_text_uncached(self, prompt: str) -> str:
+        """Call the chat model asynchronously (rate limited, with retries)."""
+        async with self._request_slots():
+            await async_rate_limiter.acquire()
+            
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Circuit '{self.breaker.name}' is open")
+            try:
+                response = await self.model.ainvoke(prompt)
+            except Exception as e:
+                if _is_transient_error(e):
+                    self.breaker.record_failure()
+                logger.error(f"Failed to generate text: {e}")
+                raise
+            else:
+                self.breaker.record_success()
+            finally:
+                # Also ends a half-open trial on non-transient errors and cancellation
+                self.breaker.release()
+        return self._content_to_text(response.content)
+    
+    def _request_slots(self) -> asyncio.Semaphore:
+        """Semaphore bounding in-flight async provider calls on the running loop."""
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        return sem
+    
+    @staticmethod
+    def _content_to_text(content) -> str:
+        """Normalize message content (str, list of parts, other) to a string."""
+        if isinstance(content, list):
+            return ' '.join(str(item) for item in content)
+        elif not isinstance(content, str):
+            return str(content)
+        return content
+    
+    def generate_text_stream(self, prompt: str, semantic_key: Optional[str] = None, cache_namespace: str = "") -> Iterator[str]:
+        """
+        Stream generated text as it arrives from the model.
+        
+        Goes through the same response cache, rate limiter, circuit breaker
+        and retries as generate_text. Retries cover opening the stream (up to
+        the first chunk); an error after text has been yielded is re-raised.
+        
+        Args:
+            prompt: Input prompt
+            semantic_key: Text matched by similarity instead of the whole prompt
+            cache_namespace: Scope for similarity matches (one per prompt template)
+            
+        Yields:
+            Text fragments in generation order (a cached answer as one fragment)
+            
+        Raises:
+            LLMUnavailableError: If the provider circuit is open (before anything is yielded)
+        """
+        cached, emb = self._cached_response(prompt, semantic_key, cache_namespace)
+        if cached is not None:
+            logger.debug(f"Response cache hit for prompt: {prompt[:100]}...")
+            yield cached
+            return
+        
+        try:
+            first, stream = self._open_stream(prompt)
+        except CircuitOpenError as e:
+            raise LLMUnavailableError(self._fallback_response(emb, cache_namespace)) from e
+        
+        parts = []
+        try:
+            chunk = first
+            while chunk is not None:
+                text = self._content_to_text(chunk.content)
+                if text:
+                    parts.append(text)
+                    yield text
+                chunk = next(stream, None)
+        except Exception as e:
+            if _is_transient_error(e):
+                self.breaker.record_failure()
+            logger.error(f"Failed to stream text: {e}")
+            raise
+        finally:
+            stream.close()
+        
+        logger.debug(f"Streamed response for prompt: {prompt[:100]}...")
+        if self.response_cache is not None and parts:
+            self.response_cache.put(prompt, ''.join(parts), emb, cache_namespace)
+    
+    @retry_transient
+    def _open_stream(self, prompt: str):
+        """Start a model stream and read its first chunk (rate limited, with retries)."""
+        # Apply rate limiting
+        rate_limiter.wait_if_needed()
+        
+        # The request is only sent when the first chunk is pulled
+        stream = self.model.stream(prompt)
+        try:
+            first = self._call_with_breaker(next, stream, None)
+        except Exception as e:
+            stream.close()
+            logger.error(f"Failed to stream text: {e}")
+            raise
+        return first, stream
+    
+    @retry_transient
     def generate_embedding(self, text: str) -> list[float]:
         """
         Generate embedding for text using Gemini.
@@ -139,7 +457,135 @@ class GeminiLLM:
         except Exception as e:
             logger.error(f"Failed to generate embedding: {e}")
             raise
+    
+    def cached_generate_embedding(self, text: str) -> list[float]:
+        """
+        Generate embedding for text, serving repeats from the on-disk cache.
+        
+        Args:
+            text: Input text
+            
+        Returns:
+            Embedding vector
+        """
+        embedding_cache = get_embedding_cache()
+        key = embedding_cache.make_key(self.embedding_model, text)
+        embedding = embedding_cache.get(key)
+        if embedding is None:
+            embedding = self.generate_embedding(text)
+            embedding_cache.put(key, embedding, model=self.embedding_model)
+        return embedding
+    
+    @retry_transient
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """Embed a single provider-sized batch in one request."""
+        # Apply rate limiting (one request per batch)
+        rate_limiter.wait_if_needed()
+        
+        try:
+            return self.embeddings.embed_documents(texts)
+        except Exception as e:
+            logger.error(f"Failed to generate embeddings batch: {e}")
+            raise
+    
+    @retry_transient
+    async def agenerate_embedding(self, text: str) -> list[float]:
+        """
+        Async variant of generate_embedding.
+        
+        Args:
+            text: Input text
+            
+        Returns:
+            Embedding vector
+        """
+        async with self._request_slots():
+            await async_rate_limiter.acquire()
+            
+            try:
+                return await self.embeddings.aembed_query(text)
+            except Exception as e:
+                logger.error(f"Failed to generate embedding: {e}")
+                raise
+    
+    @retry_transient
+    async def agenerate_embeddings_batch(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed a single provider-sized batch in one async request.
+        
+        Args:
+            texts: Input texts (at most max_embed_batch)
+            
+        Returns:
+            Embedding vectors, one per input text
+        """
+        async with self._request_slots():
+            await async_rate_limiter.acquire()
+            
+            try:
+                return await self.embeddings.aembed_documents(texts)
+            except Exception as e:
+                logger.error(f"Failed to generate embeddings batch: {e}")
+                raise
+    
+    @staticmethod
+    def _is_rate_limit_error(error: Exception) -> bool:
+        """Check whether an error (possibly wrapped by tenacity) is a 429 / quota error."""
+        if isinstance(error, RetryError):
+            error = error.last_attempt.exception() or error
+        if getattr(error, 'status_code', None) == 429:
+            return True
+        message = str(error).lower()
+        return '429' in message or 'rate limit' in message or 'resource_exhausted' in message
+    
+    def _embed_batch_adaptive(self, texts: list[str]) -> list[list[float]]:
+        """Embed a batch, splitting it in half and retrying when the provider rate-limits it."""
+        try:
+            return self._embed_batch(texts)
+        except Exception as e:
+            if len(texts) <= 1 or not self._is_rate_limit_error(e):
+                raise
+            mid = len(texts) // 2
+            logger.warning(f"Embedding batch of {len(texts)} rate limited; splitting into {mid} + {len(texts) - mid}")
+            return self._embed_batch_adaptive(texts[:mid]) + self._embed_batch_adaptive(texts[mid:])
+    
+    def generate_embeddings_batch(self, texts: list[str], batch_size: int = 96) -> list[list[float]]:
+        """
+        Generate embeddings for many texts, sending several texts per request.
+        
+        Texts are sorted by length before batching so each request carries
+        similarly sized inputs; results are returned in the original order.
+        A batch that hits the provider rate limit is split and retried.
+        
+        Args:
+            texts: Input texts
+            batch_size: Texts per request (capped at the provider maximum)
+            
+        Returns:
+            Embedding vectors, one per input text
+        """
+        if not texts:
+            return []
+        
+        batch_size = max(1, min(batch_size, self.max_embed_batch))
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        
+        embeddings: list[Optional[list[float]]] = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            vectors = self._embed_batch_adaptive([texts[i] for i in batch_idx])
+            for i, vector in zip(batch_idx, vectors):
+                embeddings[i] = vector
+        
+        logger.debug(f"Generated {len(texts)} embeddings in batches of {batch_size}")
+        return embeddings
+
+
+@cache
+def get_llm() -> GeminiLLM:
+    """Return the process-wide GeminiLLM instance."""
+    return GeminiLLM()
 
 
 # Global LLM instance
-llm = GeminiLLM()
+llm = get_llm()
@@ -0,0 +1,30 @@
+"""
+PDF text extraction.
+
+Kept free of import-time side effects (no clients, caches or database
+handles) because ProcessPoolExecutor workers import this module to unpickle
+extract_text_from_pdf.
+"""
+import logging
+from pathlib import Path
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+
+def extract_text_from_pdf(pdf_path: Path) -> str:
+    """Extract text from a PDF file, or return "" if it cannot be read."""
+    try:
+        reader = PdfReader(str(pdf_path))
+        parts = []
+        # Fetch pages one at a time so each Page object can be freed after use
+        for i in range(reader.get_num_pages()):
+            page = reader.get_page(i)
+            page_text = page.extract_text()
+            if page_text:
+                parts.append(page_text)
+            del page
+        return "\n".join(parts)
+    except Exception as e:
+        logger.error(f"Failed to extract PDF {pdf_path}: {e}")
+        return ""
@@ -1,106 +1,327 @@
 """
 Security utilities for SQL validation and rate limiting.
 """
+import os
+import re
+import sys
 import time
-import sqlparse
-from sqlparse.sql import Statement
-from sqlparse.tokens import Keyword, DML
-from typing import Optional
+import asyncio
+from functools import lru_cache
+from types import ModuleType
+from typing import TYPE_CHECKING, ClassVar, Optional
 import logging
 import threading
 
+if TYPE_CHECKING:
+    from sqlparse.sql import Statement
+
 logger = logging.getLogger(__name__)
 
+# sqlparse module, imported on first use (most queries take the fast path)
+_sqlparse: Optional[ModuleType] = None
+
+# Matches a trailing LIMIT clause (optionally with offset), capturing the row count
+_TRAILING_LIMIT_RE = re.compile(
+    r'\bLIMIT\s+(?:\d+\s*,\s*)?(?P<count>\d+)(?:\s+OFFSET\s+\d+)?\s*$', re.IGNORECASE
+)
+
+
+# Longer queries are not interned, to keep the interned-string table small
+MAX_INTERNED_QUERY_LENGTH = 1024
+
+def _load_sqlparse() -> ModuleType:
+    """Import sqlparse on first use and return the module."""
+    global _sqlparse
+    if _sqlparse is None:
+        import sqlparse
+        import sqlparse.tokens
+        _sqlparse = sqlparse
+    return _sqlparse
+
+
+# Single-slot cache of the most recent (query, validation result)
+_last_validation: Optional[tuple[str, tuple[bool, Optional[str]]]] = None
+
+
+@lru_cache(maxsize=2048)
+def _validate_cached(query: str) -> tuple[bool, Optional[str]]:
+    """Parse and check a stripped, non-empty query (see SQLValidator.validate_query)."""
+    # File access is refused on the raw text, wherever it appears
+    match = _FILE_ACCESS_RE.search(query)
+    if match:
+        return False, f"Dangerous keyword detected: {' '.join(match.group(0).upper().split())}"
+    
+    # Fast path: a single SELECT/WITH statement with no dangerous word anywhere
+    # in its text cannot fail any check below, so skip parsing it
+    if _FAST_PATH_RE.match(query) and ';' not in query and _DANGER_RE.search(query) is None:
+        return True, None
+    
+    # Parse the SQL query
+    try:
+        parsed = _load_sqlparse().parse(query)
+    except Exception as e:
+        return False, f"Failed to parse SQL: {str(e)}"
+    
+    if not parsed:
+        return False, "No valid SQL statement found"
+    
+    # Check for multiple statements (semicolon injection)
+    if len(parsed) > 1:
+        return False, "Multiple SQL statements not allowed"
+    
+    # Token-level keyword checks are only needed if the raw text could hold one
+    has_danger = _DANGER_RE.search(query) is not None
+    result = _scan_statement(parsed[0], check_keywords=has_danger)
+    if not result[0] or not has_danger:
+        return result
+    
+    # sqlparse does not lex strings the way MySQL does (e.g. backslash escapes),
+    # so a dangerous word its tokens put inside a literal is only accepted if
+    # the raw text proves it is inside one
+    masked = _mask_literals(query)
+    if masked is None:
+        return False, "Dangerous keyword detected in query with ambiguous quoting"
+    for match in _DANGER_RE.finditer(masked):
+        word = match.group(0).upper()
+        # REPLACE() and INSERT() are also string functions; as statements they
+        # cannot appear inside a single SELECT
+        if word in _STRING_FUNCTIONS and masked[match.end():].lstrip().startswith('('):
+            continue
+        return False, f"Dangerous keyword detected: {word}"
+    return True, None
+
+
+def _mask_literals(query: str) -> Optional[str]:
+    """
+    Blank out quoted strings and identifiers, keeping code and comments.
+    
+    Returns None if the quoting cannot be determined from the text alone:
+    any backslash (escaping depends on the server's SQL mode) or an
+    unterminated quote or comment.
+    """
+    if '\\' in query:
+        return None
+    parts: list[str] = []
+    pos = 0
+    for match in _QUOTED_RE.finditer(query):
+        if match.lastgroup == 'open':
+            return None
+        parts.append(query[pos:match.start()])
+        parts.append(' ' if match.lastgroup == 'quoted' else match.group(0))
+        pos = match.end()
+    parts.append(query[pos:])
+    return ''.join(parts)
+
+
+def _scan_statement(statement: 'Statement', check_keywords: bool = True) -> tuple[bool, Optional[str]]:
+    """
+    Check statement type and dangerous keywords in a single pass over its tokens.
+    
+    The type is taken from the first significant token (skipping opening
+    parentheses); WITH counts as SELECT since any data-modifying statement
+    after a CTE is caught by the keyword check. Keywords are matched on
+    parsed tokens, so identifiers (update_time), string literals and
+    comments do not trigger a match here (the caller re-checks the raw text
+    for keywords outside literals). With check_keywords=False only the
+    statement type is checked.
+    """
+    tokens = _load_sqlparse().tokens
+    stmt_type = None
+    after_into = False
+    for token in statement.flatten():
+        if token.is_whitespace:
+            continue
+        if token.ttype in tokens.Comment:
+            # MySQL executes the body of /*! ... */ comments
+            if token.value.startswith('/*!'):
+                return False, "Executable comments not allowed"
+            continue
+        
+        if stmt_type is None:
+            if token.ttype in tokens.Punctuation and token.value == '(':
+                continue
+            if token.normalized in _SELECT_LEADERS:
+                stmt_type = 'SELECT'
+            else:
+                stmt_type = token.normalized if token.is_keyword else 'UNKNOWN'
+            if stmt_type not in SQLValidator.ALLOWED_TYPES:
+                return False, f"Only SELECT queries allowed. Found: {stmt_type}"
+            if not check_keywords:
+                return True, None
+        
+        if after_into and token.value.upper() in _INTO_FILE_TARGETS:
+            return False, f"Dangerous keyword detected: INTO {token.value.upper()}"
+        if token.is_keyword and token.normalized in _DANGEROUS_KEYWORD_SET:
+            return False, f"Dangerous keyword detected: {token.normalized}"
+        after_into = token.is_keyword and token.normalized == 'INTO'
+    
+    if stmt_type is None:
+        return False, "Only SELECT queries allowed. Found: UNKNOWN"
+    return True, None
+
 
 class SQLValidator:
     """Validates SQL queries to ensure read-only operations."""
     
     # Allowed SQL statement types
-    ALLOWED_TYPES = {'SELECT'}
+    ALLOWED_TYPES: ClassVar[frozenset[str]] = frozenset({sys.intern('SELECT')})
     
-    # Dangerous keywords that should never appear
-    DANGEROUS_KEYWORDS = {
+    # Dangerous keywords that should never appear (interned, uppercase)
+    DANGEROUS_KEYWORDS: ClassVar[frozenset[str]] = frozenset(sys.intern(k) for k in (
         'INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 
         'TRUNCATE', 'REPLACE', 'MERGE', 'GRANT', 'REVOKE',
         'EXEC', 'EXECUTE', 'CALL', 'LOAD', 'INTO OUTFILE', 'INTO DUMPFILE'
-    }
+    ))
     
     @staticmethod
     def validate_query(query: str) -> tuple[bool, Optional[str]]:
         """
         Validate that a SQL query is safe (read-only).
         
+        Results are memoized per query, so repeated queries skip parsing.
+        
         Args:
             query: SQL query string to validate
             
         Returns:
             Tuple of (is_valid, error_message)
         """
-        if not query or not query.strip():
-            return False, "Empty query"
-        
-        # Parse the SQL query
-        try:
-            parsed = sqlparse.parse(query)
-        except Exception as e:
-            return False, f"Failed to parse SQL: {str(e)}"
-        
-        if not parsed:
-            return False, "No valid SQL statement found"
+        global _last_validation
         
-        # Check for multiple statements (semicolon injection)
-        if len(parsed) > 1:
-            return False, "Multiple SQL statements not allowed"
+        # Back-to-back repeats of the same query skip even the LRU lookup
+        last = _last_validation
+        if last is not None and (query is last[0] or query == last[0]):
+            return last[1]
         
-        statement: Statement = parsed[0]
-        
-        # Check statement type
-        stmt_type = statement.get_type()
+        if not query or not query.strip():
+            return False, "Empty query"
         
-        # Fallback: parsing sometimes returns UNKNOWN for valid SELECTs with complex formatting
-        if stmt_type == 'UNKNOWN':
-            first_token_str = str(statement.tokens[0]).upper() if statement.tokens else ""
-            if query.strip().upper().startswith('SELECT') or 'SELECT' in first_token_str:
-                stmt_type = 'SELECT'
-                
-        if stmt_type not in SQLValidator.ALLOWED_TYPES:
-            return False, f"Only SELECT queries allowed. Found: {stmt_type}"
+        # Only outer whitespace is normalized for the cache key: inner newlines
+        # end `--` comments, so collapsing them could change what is validated
+        key = query.strip()
+        if len(key) <= MAX_INTERNED_QUERY_LENGTH:
+            # Repeated queries then share one object, so cache key compares are identity checks
+            key = sys.intern(key)
+        result = _validate_cached(key)
+        if result[0]:
+            logger.debug(f"SQL query validated successfully: {query[:100]}...")
+        _last_validation = (query, result)
+        return result
+    
+    @staticmethod
+    def enforce_limit(query: str, max_rows: int) -> str:
+        """
+        Make a query end with a LIMIT of at most max_rows.
         
-        # Check for dangerous keywords in the entire query
-        query_upper = query.upper()
-        for keyword in SQLValidator.DANGEROUS_KEYWORDS:
-            if keyword in query_upper:
-                return False, f"Dangerous keyword detected: {keyword}"
+        A query without a trailing LIMIT gets one appended; a larger trailing
+        LIMIT is lowered to max_rows. This is what bounds the rows the server
+        sends (execute_query's row cap only bounds memory).
         
-        logger.debug(f"SQL query validated successfully: {query[:100]}...")
-        return True, None
+        Args:
+            query: SQL query string
+            max_rows: Row limit to apply
+            
+        Returns:
+            Query guaranteed to end with a LIMIT clause of at most max_rows
+        """
+        query = query.rstrip().rstrip(';').rstrip()
+        if not query:
+            return query
+        match = _TRAILING_LIMIT_RE.search(query)
+        if match:
+            # A LIMIT behind a line comment is not a clause
+            line = query[query.rfind('\n', 0, match.start()) + 1:match.start()]
+            if '--' in line or '#' in line:
+                match = None
+        if match is None:
+            return f"{query}\nLIMIT {max_rows}"
+        if int(match.group('count')) > max_rows:
+            return f"{query[:match.start('count')]}{max_rows}{query[match.end('count'):]}"
+        return query
+
+
+# Leading keywords of a read-only query
+_SELECT_LEADERS = frozenset({'SELECT', 'WITH'})
+
+# Single-token dangerous keywords, and the targets that make INTO dangerous
+_DANGEROUS_KEYWORD_SET = frozenset(k for k in SQLValidator.DANGEROUS_KEYWORDS if ' ' not in k)
+_INTO_FILE_TARGETS = frozenset(
+    sys.intern(k.split()[1]) for k in SQLValidator.DANGEROUS_KEYWORDS if k.startswith('INTO ')
+)
+
+# Prefilter over the raw query: any dangerous keyword (or INTO target) as a
+# whole word, or an executable comment. No match means the token scan can
+# stop after the statement type.
+_DANGER_RE = re.compile(
+    r'\b(?:' + '|'.join(sorted(_DANGEROUS_KEYWORD_SET | _INTO_FILE_TARGETS)) + r')\b|/\*!',
+    re.IGNORECASE
+)
+
+# File reads and writes, rejected even inside string literals
+_FILE_ACCESS_RE = re.compile(
+    r'\b(?:INTO\s+(?:OUTFILE|DUMPFILE)|OUTFILE|DUMPFILE|LOAD_FILE)\b', re.IGNORECASE
+)
+
+# Dangerous keywords that are also MySQL function names when followed by "("
+_STRING_FUNCTIONS = frozenset({'REPLACE', 'INSERT'})
+
+# MySQL quoted strings/identifiers (doubled quote escapes), comments, and
+# unterminated openers; leftmost match wins, so quotes inside comments and
+# comment markers inside quotes are handled
+_QUOTED_RE = re.compile(
+    r"(?P<quoted>'(?:''|[^'])*'|\"(?:\"\"|[^\"])*\"|`(?:``|[^`])*`)"
+    r"|(?P<comment>#[^\n]*|--(?=[\x00-\x20]|$)[^\n]*|/\*.*?\*/)"
+    r"|(?P<open>['\"`]|/\*)",
+    re.DOTALL
+)
+
+# Queries starting with SELECT or WITH are candidates for the parse-free fast path
+_FAST_PATH_RE = re.compile(r'(?:SELECT|WITH)\b', re.IGNORECASE)
 
 
 class RateLimiter:
     """Token bucket rate limiter for API calls."""
     
-    def __init__(self, max_requests_per_minute: int = 60):
+    # Fixed attribute slots: allow_request reads these on every call
+    __slots__ = ('max_requests', 'tokens', 'last_update', 'lock', '_inv_period')
+    
+    def __init__(self, max_requests_per_minute: int = 60, thread_safe: bool = True):
         """
         Initialize rate limiter.
         
         Args:
             max_requests_per_minute: Maximum number of requests allowed per minute
+            thread_safe: Guard token updates with a lock. Pass False only when
+                the limiter is used from a single thread (e.g. one event loop).
         """
         self.max_requests = max_requests_per_minute
-        self.tokens = max_requests_per_minute
-        self.last_update = time.time()
-        self.lock = threading.Lock()
+        self.tokens = float(max_requests_per_minute)
+        self.last_update = time.monotonic()
+        self.lock = threading.Lock() if thread_safe else None
+        # Tokens added per second
+        self._inv_period = max_requests_per_minute / 60.0
         
         logger.info(f"Rate limiter initialized: {max_requests_per_minute} requests/minute")
     
-    def _refill_tokens(self):
-        """Refill tokens based on time elapsed."""
-        now = time.time()
+    def _take(self, now: float, n: int) -> bool:
+        """Refill up to `now` and debit n tokens if available (caller holds the lock)."""
+        # A full bucket has nothing to refill, only the timestamp to advance
+        if self.tokens < self.max_requests:
+            self._refill_tokens(now)
+        else:
+            self.last_update = now
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+    
+    def _refill_tokens(self, now: float):
+        """Refill tokens based on time elapsed up to `now` (caller holds the lock)."""
         time_passed = now - self.last_update
+        if time_passed <= 0:
+            return  # another thread already refilled with a later timestamp
         
-        # Refill tokens: (time_passed / 60 seconds) * max_requests
-        tokens_to_add = (time_passed / 60.0) * self.max_requests
-        self.tokens = min(self.max_requests, self.tokens + tokens_to_add)
+        self.tokens = min(self.max_requests, self.tokens + time_passed * self._inv_period)
         self.last_update = now
     
     def allow_request(self) -> bool:
@@ -110,23 +331,214 @@ class RateLimiter:
         Returns:
             bool: True if request is allowed, False otherwise
         """
-        with self.lock:
-            self._refill_tokens()
+        return self.allow_requests(1)
+    
+    def allow_requests(self, n: int = 1) -> bool:
+        """
+        Check if n requests are allowed, consuming all n tokens or none.
+        
+        Args:
+            n: Number of requests the caller is about to make
             
-            if self.tokens >= 1:
-                self.tokens -= 1
-                return True
-            else:
-                logger.warning("Rate limit exceeded")
-                return False
+        Returns:
+            bool: True if all n requests are allowed, False otherwise
+            
+        Raises:
+            ValueError: If n is not between 1 and max_requests
+        """
+        self._check_count(n)
+        
+        # Read the clock before locking; the lock only guards the token update
+        now = time.monotonic()
+        
+        # Test before locking: if n tokens cannot have accrued yet, reject
+        # without touching the lock (unlocked reads may be slightly stale)
+        tokens = self.tokens
+        if tokens < n and (now - self.last_update) * self._inv_period < n - tokens:
+            logger.warning("Rate limit exceeded")
+            return False
+        
+        if self.lock is None:
+            allowed = self._take(now, n)
+        else:
+            with self.lock:
+                allowed = self._take(now, n)
+        
+        if not allowed:
+            logger.warning("Rate limit exceeded")
+        return allowed
+    
+    def _check_count(self, n: int) -> None:
+        """Reject request counts the bucket can never grant."""
+        # n < 1 would mint tokens; n > capacity would be refused forever
+        if n < 1 or n > self.max_requests:
+            raise ValueError(f"Request count must be between 1 and {self.max_requests}, got {n}")
+    
+    def seconds_until_available(self) -> float:
+        """Time until the next whole token accrues (0 if one is available now)."""
+        now = time.monotonic()
+        # A single read of each field; the lock only adds a consistent snapshot
+        if self.lock is None:
+            accrued = self.tokens + max(0.0, now - self.last_update) * self._inv_period
+        else:
+            with self.lock:
+                accrued = self.tokens + max(0.0, now - self.last_update) * self._inv_period
+        return max(0.0, 1.0 - accrued) / self._inv_period
     
     def wait_if_needed(self):
         """Block until a request can be made (waiting for rate limit)."""
         while not self.allow_request():
-            time.sleep(0.1)  # Wait 100ms before trying again
+            # Sleep exactly until the next token arrives, then retry
+            time.sleep(self.seconds_until_available())
 
 
-# Global rate limiter instance
-import os
+class AsyncRateLimiter:
+    """
+    asyncio front end for a RateLimiter.
+    
+    Tokens come from the wrapped limiter, so sync and async callers share one
+    budget. A rejected caller sleeps on the event loop until the next token
+    is due, so waiting never blocks a thread. Checks against a Redis-backed
+    limiter are network round-trips, so they run in a worker thread.
+    """
+    
+    def __init__(self, limiter: RateLimiter):
+        """
+        Initialize async rate limiter.
+        
+        Args:
+            limiter: Rate limiter whose budget is shared with sync callers
+        """
+        self.limiter = limiter
+        self._offload = isinstance(limiter, RedisRateLimiter)
+    
+    async def _allow(self) -> bool:
+        if self._offload:
+            return await asyncio.to_thread(self.limiter.allow_request)
+        return self.limiter.allow_request()
+    
+    async def acquire(self):
+        """Wait until a request can be made."""
+        while not await self._allow():
+            await asyncio.sleep(self.limiter.seconds_until_available())
+
+
+# Atomic token bucket: refill from Redis server time, then try to debit.
+# KEYS[1] = bucket key; ARGV = capacity, tokens per second, tokens requested.
+# Returns {allowed (0/1), remaining tokens as a string}.
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'last_refill')
+local tokens = tonumber(state[1]) or capacity
+local last = tonumber(state[2]) or now
+if now > last then
+    tokens = math.min(capacity, tokens + (now - last) * rate)
+    last = now
+end
+
+local allowed = 0
+if tokens >= requested then
+    tokens = tokens - requested
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'last_refill', last)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Token bucket shared by every process through Redis.
+    
+    Refill and debit run atomically in a Lua script, so all workers draw from
+    one global budget. If Redis becomes unreachable the in-process bucket
+    inherited from RateLimiter is used until it recovers.
+    """
+    
+    __slots__ = ('key', 'client', '_script', '_remote_tokens')
+    
+    def __init__(self, max_requests_per_minute: int = 60,
+                 redis_url: str = "redis://localhost:6379/0",
+                 key: str = "rate_limiter:llm"):
+        """
+        Initialize Redis rate limiter.
+        
+        Args:
+            max_requests_per_minute: Maximum number of requests allowed per minute
+            redis_url: Redis connection URL
+            key: Redis key holding the bucket state
+            
+        Raises:
+            ImportError: If the redis package is not installed
+        """
+        import redis
+        
+        super().__init__(max_requests_per_minute)
+        self.key = key
+        self.client = redis.Redis.from_url(redis_url)
+        # register_script loads the script once and calls it via EVALSHA
+        self._script = self.client.register_script(_TOKEN_BUCKET_LUA)
+        self._remote_tokens = float(max_requests_per_minute)
+        
+        logger.info(f"Redis rate limiter using {redis_url} (key '{key}')")
+    
+    def allow_requests(self, n: int = 1) -> bool:
+        """
+        Check if n requests are allowed under the shared rate limit.
+        
+        Args:
+            n: Number of requests the caller is about to make
+            
+        Returns:
+            bool: True if all n requests are allowed, False otherwise
+            
+        Raises:
+            ValueError: If n is not between 1 and max_requests
+        """
+        self._check_count(n)
+        try:
+            allowed, tokens = self._script(
+                keys=[self.key], args=[self.max_requests, self._inv_period, n]
+            )
+        except Exception as e:
+            logger.error(f"Redis rate limiter unavailable, using local bucket: {e}")
+            return super().allow_requests(n)
+        
+        self._remote_tokens = float(tokens)
+        if not allowed:
+            logger.warning("Rate limit exceeded")
+        return bool(allowed)
+    
+    def seconds_until_available(self) -> float:
+        """Time until the next whole token accrues, from the last Redis reply."""
+        return max(0.0, 1.0 - self._remote_tokens) / self._inv_period
+
+
+def create_rate_limiter(max_requests_per_minute: int) -> RateLimiter:
+    """
+    Build the rate limiter selected by RATE_LIMITER_BACKEND ("local" or "redis").
+    
+    Falls back to the in-process limiter if Redis cannot be used.
+    """
+    if os.getenv('RATE_LIMITER_BACKEND', 'local').lower() == 'redis':
+        try:
+            return RedisRateLimiter(
+                max_requests_per_minute,
+                redis_url=os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+            )
+        except Exception as e:
+            logger.warning(f"Redis rate limiter unavailable, using in-process limiter: {e}")
+    return RateLimiter(max_requests_per_minute)
+
+
+# Global rate limiter instances
 MAX_REQUESTS = int(os.getenv('MAX_REQUESTS_PER_MINUTE', 60))
-rate_limiter = RateLimiter(max_requests_per_minute=MAX_REQUESTS)
+rate_limiter = create_rate_limiter(MAX_REQUESTS)
+async_rate_limiter = AsyncRateLimiter(rate_limiter)
@@ -0,0 +1,167 @@
+"""
+In-memory semantic cache for LLM responses.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Response cache with exact and similarity matching.
+
+    Exact prompt repeats are answered from a hash lookup. Similarity matching
+    is opt-in per call: the caller passes a semantic key (the variable part of
+    its prompt, e.g. the user question) and a namespace, and the key's
+    embedding is compared by cosine similarity against cached keys in the same
+    namespace only. Embedding whole prompts would let a long shared template
+    dominate the similarity. Cached key embeddings are stored as int8 with a
+    per-vector scale.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1024):
+        """
+        Initialize semantic cache.
+
+        Args:
+            threshold: Minimum cosine similarity for a cache hit
+            max_entries: Maximum cached responses (oldest evicted first)
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._exact: OrderedDict[bytes, str] = OrderedDict()
+        self._cache_embs: Optional[np.ndarray] = None  # (N, dim) int8
+        self._cache_scales: Optional[np.ndarray] = None  # (N,) float32
+        self._cache_vals: list[str] = []
+        self._cache_ns: list[str] = []
+        self.lock = threading.Lock()
+
+        logger.info(f"Semantic cache initialized: threshold={threshold}, max_entries={max_entries}")
+
+    @staticmethod
+    def _prompt_key(prompt: str) -> bytes:
+        return hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).digest()
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    @staticmethod
+    def _quantize(emb: np.ndarray) -> tuple[np.ndarray, np.float32]:
+        """Symmetric int8 quantization with a single scale."""
+        scale = np.float32(np.abs(emb).max() / 127.0) or np.float32(1.0)
+        return np.round(emb / scale).astype(np.int8), scale
+    
+    def _similarities(self, emb: np.ndarray, namespace: str) -> Optional[np.ndarray]:
+        """
+        Cosine similarity of emb to every cached key (int32 dot, FP32 rescale).
+
+        Entries from other namespaces score -inf. Returns None if the
+        namespace has no entries. Call with the lock held.
+        """
+        if self._cache_embs is None or namespace not in self._cache_ns:
+            return None
+        q, scale = self._quantize(emb)
+        dots = self._cache_embs @ q.astype(np.int32)
+        sims = dots.astype(np.float32) * (self._cache_scales * scale)
+        other = np.fromiter((ns != namespace for ns in self._cache_ns), dtype=bool, count=len(self._cache_ns))
+        sims[other] = -np.inf
+        return sims
+    
+    def get_exact(self, prompt: str) -> Optional[str]:
+        """Return the cached response for an identical prompt, if any."""
+        with self.lock:
+            return self._exact.get(self._prompt_key(prompt))
+
+    def match(self, embedding: list[float], namespace: str) -> tuple[Optional[str], np.ndarray]:
+        """
+        Find the cached response whose semantic key is most similar.
+
+        Args:
+            embedding: Embedding of the semantic key
+            namespace: Only entries stored under this namespace are compared
+
+        Returns:
+            Tuple of (cached response or None, normalized key embedding)
+        """
+        emb = self._normalize(embedding)
+        with self.lock:
+            sims = self._similarities(emb, namespace)
+            if sims is not None:
+                best = int(np.argmax(sims))
+                if sims[best] > self.threshold:
+                    logger.debug(f"Semantic cache hit (similarity {sims[best]:.3f})")
+                    return self._cache_vals[best], emb
+        return None, emb
+
+    def lookup(
+        self,
+        prompt: str,
+        embed: Callable[[str], list[float]],
+        semantic_key: Optional[str] = None,
+        namespace: str = "",
+    ) -> tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Find a cached response for a prompt.
+
+        Args:
+            prompt: Input prompt
+            embed: Function that embeds the semantic key (only called on an exact miss)
+            semantic_key: Variable part of the prompt to match by similarity (None: exact only)
+            namespace: Similarity matches are limited to this namespace
+
+        Returns:
+            Tuple of (cached response or None, normalized key embedding or None)
+        """
+        cached = self.get_exact(prompt)
+        if cached is not None or semantic_key is None:
+            return cached, None
+        return self.match(embed(semantic_key), namespace)
+
+    def nearest(self, emb: np.ndarray, namespace: str = "") -> Optional[str]:
+        """Return the response whose key is most similar to emb, ignoring the threshold."""
+        with self.lock:
+            sims = self._similarities(emb, namespace)
+            if sims is None:
+                return None
+            return self._cache_vals[int(np.argmax(sims))]
+
+    def put(self, prompt: str, response: str, emb: Optional[np.ndarray], namespace: str = ""):
+        """
+        Store a response.
+
+        Args:
+            prompt: Input prompt
+            response: Generated response
+            emb: Normalized key embedding returned by lookup/match (None: exact only)
+            namespace: Namespace the embedding was matched in
+        """
+        key = self._prompt_key(prompt)
+        with self.lock:
+            self._exact[key] = response
+            if emb is not None:
+                q, scale = self._quantize(emb)
+                row = q[np.newaxis, :]
+                scales = np.array([scale], dtype=np.float32)
+                if self._cache_embs is None:
+                    self._cache_embs, self._cache_scales = row, scales
+                else:
+                    self._cache_embs = np.vstack([self._cache_embs, row])
+                    self._cache_scales = np.concatenate([self._cache_scales, scales])
+                self._cache_vals.append(response)
+                self._cache_ns.append(namespace)
+
+            if len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+            if len(self._cache_vals) > self.max_entries:
+                self._cache_vals.pop(0)
+                self._cache_ns.pop(0)
+                self._cache_embs = self._cache_embs[1:]
+                self._cache_scales = self._cache_scales[1:]
@@ -0,0 +1,139 @@
+"""
+Optional sqlite-vec vector index for fast nearest-neighbour retrieval.
+"""
+import json
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteVecIndex:
+    """Vector index backed by a sqlite-vec `vec0` virtual table."""
+
+    def __init__(self, db_path: str):
+        """
+        Open (or create) the index database and load the sqlite-vec extension.
+
+        Args:
+            db_path: Path to the SQLite database file
+
+        Raises:
+            ImportError: If the sqlite-vec package is not installed
+            sqlite3.Error: If the extension cannot be loaded
+        """
+        import sqlite_vec
+
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._serialize = sqlite_vec.serialize_float32
+
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.enable_load_extension(True)
+        sqlite_vec.load(self.conn)
+        self.conn.enable_load_extension(False)
+
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS vec_meta "
+            "(rowid INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE, document TEXT, metadata TEXT)"
+        )
+        self.conn.commit()
+        self.lock = threading.Lock()
+
+        logger.info(f"sqlite-vec index opened: {self.db_path}")
+
+    def _has_vec_table(self) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'vec_chunks'"
+        ).fetchone()
+        return row is not None
+
+    def count(self) -> int:
+        """Return the number of indexed chunks."""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM vec_meta").fetchone()[0]
+
+    def add(self,
+            documents: list[str],
+            embeddings: list[list[float]],
+            metadatas: list[dict],
+            ids: list[str]):
+        """
+        Add (or replace) chunks in the index.
+
+        Args:
+            documents: Chunk texts
+            embeddings: Chunk embedding vectors
+            metadatas: Chunk metadata dictionaries
+            ids: Unique chunk IDs
+        """
+        if not documents:
+            return
+
+        with self.lock:
+            if not self._has_vec_table():
+                dim = len(embeddings[0])
+                self.conn.execute(
+                    f"CREATE VIRTUAL TABLE vec_chunks USING vec0("
+                    f"embedding FLOAT[{dim}] distance_metric=cosine)"
+                )
+
+            for doc, emb, meta, chunk_id in zip(documents, embeddings, metadatas, ids):
+                existing = self.conn.execute(
+                    "SELECT rowid FROM vec_meta WHERE chunk_id = ?", (chunk_id,)
+                ).fetchone()
+                if existing:
+                    self.conn.execute("DELETE FROM vec_chunks WHERE rowid = ?", existing)
+                    self.conn.execute("DELETE FROM vec_meta WHERE rowid = ?", existing)
+
+                cursor = self.conn.execute(
+                    "INSERT INTO vec_meta (chunk_id, document, metadata) VALUES (?, ?, ?)",
+                    (chunk_id, doc, json.dumps(meta))
+                )
+                self.conn.execute(
+                    "INSERT INTO vec_chunks (rowid, embedding) VALUES (?, ?)",
+                    (cursor.lastrowid, self._serialize(emb))
+                )
+            self.conn.commit()
+
+    def query(self, embedding: list[float], k: int = 5) -> list[tuple[str, dict, float]]:
+        """
+        Find the k nearest chunks to an embedding.
+
+        Args:
+            embedding: Query embedding
+            k: Number of results
+
+        Returns:
+            List of (document, metadata, distance) tuples, nearest first
+        """
+        with self.lock:
+            if not self._has_vec_table():
+                return []
+            # KNN limit as a `k = ?` constraint: LIMIT on vec0 needs SQLite >= 3.41
+            rows = self.conn.execute(
+                "SELECT m.document, m.metadata, v.distance "
+                "FROM (SELECT rowid, distance FROM vec_chunks "
+                "      WHERE embedding MATCH ? AND k = ?) v "
+                "JOIN vec_meta m ON m.rowid = v.rowid "
+                "ORDER BY v.distance",
+                (self._serialize(embedding), k)
+            ).fetchall()
+        return [(doc, json.loads(meta), distance) for doc, meta, distance in rows]
+
+
+def open_sqlite_vec_index(db_path: str) -> Optional[SqliteVecIndex]:
+    """
+    Open a sqlite-vec index, returning None if the extension is unavailable.
+
+    Args:
+        db_path: Path to the SQLite database file
+    """
+    try:
+        return SqliteVecIndex(db_path)
+    except (ImportError, AttributeError, sqlite3.Error) as e:
+        logger.warning(f"sqlite-vec unavailable, falling back to ChromaDB: {e}")
+        return None
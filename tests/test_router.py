@@ -0,0 +1,44 @@
+"""
+Tests for the keyword stage of the query router.
+"""
+import os
+
+import pytest
+
+# Importing the router builds the LLM client, which needs a key (no calls are made)
+os.environ.setdefault('GOOGLE_API_KEY', 'test-key')
+
+from src.agents.router import QueryRouter  # noqa: E402
+
+
+@pytest.fixture
+def router():
+    return QueryRouter()
+
+
+@pytest.mark.parametrize("query", [
+    "How many invoices exceed 50000?",
+    "How many invoices exceeded 1 lakh last month?",
+    "Show invoices with amounts exceeding 100000",
+    "Count the transactions exceeding 2 lakh",
+])
+def test_aggregate_comparison_without_rule_is_data(router, query):
+    assert router.classify_by_rules(query) == "data"
+
+
+@pytest.mark.parametrize("query", [
+    "Find transactions exceeding ITC limits",
+    "How many invoices exceed the Rule 86B threshold?",
+    "Show invoices violating Rule 86B",
+    "List vendors that are non-compliant",
+])
+def test_comparison_against_rule_is_hybrid(router, query):
+    assert router.classify_by_rules(query) == "hybrid"
+
+
+@pytest.mark.parametrize("query", [
+    "What is Rule 86B?",
+    "Explain input tax credit",
+])
+def test_rule_question_is_regulatory(router, query):
+    assert router.classify_by_rules(query) == "regulatory"